@@ -0,0 +1,129 @@
+import argparse
+import itertools
+import json
+import platform
+import random
+import subprocess
+import numpy as np
+from datetime import datetime
+from calculator import Calculator, get_width_height, calculate_center_of_mass_velocity
+from particles_factory import make_particles
+from instrumentation import Instrumentation
+import numba_backend
+
+
+def available_backends():
+    return ['numpy', 'numba', 'numba_parallel'] if numba_backend.NUMBA_AVAILABLE else ['numpy']
+
+
+def make_case(particles_count, density, cut_off_distance, seed, skin=None):
+    # make_particles draws velocities from the global `random`, seeding it keeps setups identical
+    random.seed(seed)
+    width, height = get_width_height(particles_count, density)
+    particles = make_particles(width, height, particles_count, cut_off_distance, velocity_mul=4, skin=skin)
+    particles.arrays.velocities -= calculate_center_of_mass_velocity(particles)
+    return width, height, particles
+
+
+def run_case(particles_count, density, cut_off_distance, backend, steps, warmup_steps, seed, skin=None):
+    width, height, particles = make_case(particles_count, density, cut_off_distance, seed, skin)
+    calculator = Calculator(width, height, particles, cut_off_distance=cut_off_distance, backend=backend)
+
+    # Warm-up steps also trigger JIT compilation, they are not measured
+    for _ in range(warmup_steps):
+        calculator.iteration_2(particles, log_time=False)
+
+    calculator.instrumentation = Instrumentation()
+    for _ in range(steps):
+        calculator.iteration_2(particles, log_time=False)
+    calculator.close()
+
+    summary = calculator.instrumentation.summary()
+    phases = {
+        phase: {
+            'seconds_per_step': values['total_ns'] / steps / 1e9,
+            **{name: value / 1e9 for name, value in values['percentiles_ns'].items()},
+        }
+        for phase, values in summary['phases'].items()
+    }
+    seconds_per_step = sum(phase['seconds_per_step'] for phase in phases.values())
+
+    return {
+        'particles': particles_count,
+        'density': density,
+        'cut_off_distance': cut_off_distance,
+        'backend': backend,
+        'skin': skin,
+        'steps': steps,
+        'seconds_per_step': seconds_per_step,
+        'seconds_per_particle_step': seconds_per_step / particles_count,
+        'pairs_per_second': summary['counters']['pairs_evaluated'] / (seconds_per_step * steps),
+        'pairs_inside_cut_off_ratio': summary['counters']['pairs_inside_cut_off'] / max(summary['counters']['pairs_evaluated'], 1),
+        'phases': phases,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+
+def compare(results, baseline_results):
+    key = lambda result: (result['particles'], result['density'], result['cut_off_distance'], result['backend'], result['skin'])
+    baseline = {key(result): result for result in baseline_results}
+    for result in results:
+        if key(result) in baseline:
+            ratio = result['seconds_per_step'] / baseline[key(result)]['seconds_per_step']
+            print(f'{key(result)}: {ratio:.2f}x the baseline time per step')
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the acid integrator')
+    parser.add_argument('--particles', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--densities', type=float, nargs='+', default=[0.81])
+    parser.add_argument('--cut-off-distances', type=float, nargs='+', default=[2.5])
+    parser.add_argument('--backends', nargs='+', default=None, help='defaults to every available backend')
+    parser.add_argument('--skin', type=float, default=None)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--warmup-steps', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--compare', default=None, help='earlier JSON output to compare against')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    backends = arguments.backends or available_backends()
+
+    results = []
+    cases = itertools.product(arguments.particles, arguments.densities, arguments.cut_off_distances, backends)
+    for particles_count, density, cut_off_distance, backend in cases:
+        result = run_case(particles_count, density, cut_off_distance, backend,
+                          arguments.steps, arguments.warmup_steps, arguments.seed, arguments.skin)
+        results.append(result)
+        print(f"N={particles_count} density={density} cut_off={cut_off_distance} {backend}: "
+              f"{result['seconds_per_step'] * 1000:.2f} ms/step, "
+              f"{result['seconds_per_particle_step'] * 1e6:.3f} us/particle, "
+              f"{result['pairs_per_second']:.3e} pairs/s")
+
+    with open(arguments.output, 'w') as file:
+        json.dump({'environment': environment(), 'arguments': vars(arguments), 'results': results}, file, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            compare(results, json.load(file)['results'])
+
+
+if __name__ == '__main__':
+    main()
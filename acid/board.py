@@ -1,6 +1,5 @@
 import sys
 import pygame
-import matplotlib.pyplot as plt
 
 from time import time
 from typing import Dict, List
@@ -9,6 +8,8 @@ from pygame_painter import PygamePainter
 from calculator import Calculator, calculate_center_of_mass_velocity
 from particles_factory import ParticlesCells
 from file_logger import FileLogger
+from observer_bus import ObserverBus
+from checkpoint import save_checkpoint
 
 
 class Board:
@@ -22,11 +23,14 @@ class Board:
         self.ticks_per_second = kwargs.get('ticks_per_second', 60)
         self.delta_time = kwargs.get('delta_time', 0.01)
         self.cut_off_distance = kwargs.get('cut_off_distance', 2.5)
+        self.observer_policy = kwargs.get('observer_policy', 'block')
+        # Thermostat and barostat stages, see thermostats.py
+        self.stages = kwargs.get('stages', [])
 
         if (not pygame.get_init()):
             pygame.init()
 
-    def start(self, particles: ParticlesCells):
+    def start(self, particles: ParticlesCells, remove_drift=True):
         clock = pygame.time.Clock()
         screen = pygame.display.set_mode((self.window_width, self.window_height))
 
@@ -34,11 +38,15 @@ class Board:
         painter = PygamePainter(screen, scale)
         logger = PlotLogger()
         fileLogger = FileLogger('last_particles_state', 'csv')
-        calculator = Calculator(self.width, self.height, particles, delta_time=self.delta_time, cut_off_distance=self.cut_off_distance)
+        observer_bus = ObserverBus(self.observer_policy, queue_size=64)
+        observer_bus.subscribe(logger)
+        calculator = Calculator(self.width, self.height, particles, delta_time=self.delta_time,
+                                cut_off_distance=self.cut_off_distance, observer_bus=observer_bus, stages=self.stages)
 
-        center_of_mass_velocity = calculate_center_of_mass_velocity(particles)
-        for p in particles.iterate_throw_particles():
-            p.velocity.coordinates -= center_of_mass_velocity
+        # A resumed run continues the saved trajectory untouched
+        if remove_drift:
+            center_of_mass_velocity = calculate_center_of_mass_velocity(particles)
+            particles.arrays.velocities -= center_of_mass_velocity
 
         condition = True
         iteration_index = 1
@@ -49,9 +57,10 @@ class Board:
                 if event.type == pygame.QUIT:
                     condition = False
 
-            calculator.iteration_2(particles, log_time=(iteration_index % 50 == 0))
-            logger.log_particles(particles)
+            calculator.step(particles, log_time=(iteration_index % 50 == 0))
 
+            # A barostat rescales the box, which is drawn filling the window
+            painter.scale = self.window_width / calculator.width
             painter.draw_particles(particles)
 
             pygame.display.update()
@@ -60,7 +69,14 @@ class Board:
                 print(f'Iteration {iteration_index} - DONE')
             iteration_index += 1
 
+        if particles.skin is not None:
+            print(f'Verlet list rebuild rate ~> {particles.rebuild_rate * 100:.1f}% of {particles.updates_count} updates')
+
+        print(f'Average frame time ~> {painter.frame_time * 1000:.2f} ms')
+
+        observer_bus.close()
         fileLogger.log_particles(particles)
+        save_checkpoint('last_particles_state.npz', particles, calculator)
         logger.dispose()
 
     def calculate_and_check_scale(self):
@@ -1,94 +1,249 @@
 from typing import List
 from particle import Particle
 from vector import Vector2D
-from time import time
+from time import perf_counter_ns
 from particles_factory import ParticlesCells
+from forces import pair_forces
+from potentials import LennardJones
+from integrators import VelocityVerlet
+import numba_backend
 import math
+import warnings
 import numpy as np
 class Calculator:
     def __init__(self, width, height, initial_particles, **kwargs):
         self.width = width
         self.height = height
+        # Set for three dimensional boxes, see ParticlesCells
+        self.depth = kwargs.get('depth', None)
         self.delta_time = kwargs.get('delta_time', 0.001)
         self.cut_off_distance = kwargs.get('cut_off_distance', 2.5)
+        # 'numpy', 'numba', 'numba_parallel' or 'python' (scalar per-pair reference path)
+        self.backend = kwargs.get('backend', 'numpy')
 
-    def limit_condition_periodic(self, particle):
-        particle.center.x %= self.width
-        particle.center.y %= self.height
+        # Pair potential evaluated from r^2, see potentials.py; plain truncated Lennard-Jones by default
+        self.potential = kwargs.get('potential', LennardJones())
+
+        if self.backend not in ('numpy', 'numba', 'numba_parallel', 'python'):
+            raise ValueError(f'Unknown backend {self.backend}')
+        if self.backend.startswith('numba') and self.potential != LennardJones():
+            warnings.warn(f'{self.backend} backend only has the plain Lennard-Jones kernel, {self.potential} runs on numpy')
+            self.backend = 'numpy'
+        if self.backend.startswith('numba') and not numba_backend.compile_kernels():
+            warnings.warn(f'numba is not installed, {self.backend} backend falls back to numpy')
+            self.backend = 'numpy'
+
+        # Advances the particles in step(), see integrators.py; AdaptiveTimeStep also changes delta_time
+        self.integrator = kwargs.get('integrator', VelocityVerlet())
+        self.simulated_time = 0.0
+
+        # Thermostats and barostats applied to the arrays at the end of every step, see thermostats.py
+        self.stages = list(kwargs.get('stages', []))
+
+        # Candidate pairs handed to the force kernel during the last force computation, and those inside the cut-off
+        self.pairs_count = 0
+        self.pairs_inside_count = 0
+
+        # Nanoseconds per phase of the last iteration; instrumentation.Instrumentation aggregates across iterations
+        self.phase_times = {}
+        self.instrumentation = kwargs.get('instrumentation', None)
+
+        # Worker processes for the force phase, each one owning a strip of cells
+        self.workers = kwargs.get('workers', None)
+        self.domain_decomposition = None
+
+        # Receives a snapshot after every iteration, see observer_bus.ObserverBus
+        self.observer_bus = kwargs.get('observer_bus', None)
+
+    @property
+    def box(self):
+        box = [self.width, self.height] if self.depth is None else [self.width, self.height, self.depth]
+        return np.array(box, dtype=float)
+
+    @property
+    def jit_compiled(self):
+        return self.backend.startswith('numba')
+
+    def limit_condition_periodic(self, positions: np.ndarray):
+        positions %= self.box
+
+    def step(self, particles: ParticlesCells, log_time: bool = False):
+        # One step of the integrator; returns the simulated time it covered
+        time_step = self.integrator.step(self, particles, log_time)
+        self.simulated_time += time_step
+        return time_step
 
     def iteration(self, particles: ParticlesCells, log_time: bool):
-        t1 = time()
-        for particle in particles.iterate_throw_particles():
-            particle.velocity += particle.acceleration * (self.delta_time / 2)
-            particle.translate(particle.velocity * self.delta_time)
-            self.limit_condition_periodic(particle)
-        particles.update_cells()
-        t_before = time()
-        self.drop_acceleration_and_potential(particles)
-        for particle1, particle2 in particles.iterate_throw_particle_pairs():
-            self.recompute_acceleration_and_potential(particle1, particle2)
-        t_after = time()
-
-        for particle in particles.iterate_throw_particles():
-            particle.velocity += particle.acceleration * (self.delta_time / 2)
-        t2 = time()
-        if log_time:
-            print(f'Total={t2 - t1}. Acceleration = {t_after - t_before}, F1 = {t_before - t1}, F2 = {t2 - t_after}')
+        self.phase_times = {}
+        t = perf_counter_ns()
+        self.kick(particles)
+        t = self.record_phase('kick', t)
+        particles.arrays.positions += particles.arrays.velocities * self.delta_time
+        t = self.record_phase('drift', t)
+        self.limit_condition_periodic(particles.arrays.positions)
+        t = self.record_phase('wrap', t)
+        self.cells_forces_and_kick(particles, t, log_time)
 
     def iteration_2(self, particles: ParticlesCells, log_time: bool):
-        t1 = time()
-        for particle in particles.iterate_throw_particles():
-            particle.translate(particle.velocity * self.delta_time + particle.acceleration * (self.delta_time ** 2 / 2))
-            particle.velocity += particle.acceleration * (self.delta_time / 2)
-            self.limit_condition_periodic(particle)
-        t11 = time()
+        self.phase_times = {}
+        t = perf_counter_ns()
+        self.translate(particles)
+        t = self.record_phase('drift', t)
+        if not self.jit_compiled:
+            self.limit_condition_periodic(particles.arrays.positions)
+            t = self.record_phase('wrap', t)
+        self.cells_forces_and_kick(particles, t, log_time)
+
+    def cells_forces_and_kick(self, particles: ParticlesCells, t: int, log_time: bool):
         particles.update_cells()
-        t_before = time()
-        self.drop_acceleration_and_potential(particles)
-        for particle1, particle2 in particles.iterate_throw_particle_pairs():
-            self.recompute_acceleration_and_potential(particle1, particle2)
-        t_after = time()
-
-        for particle in particles.iterate_throw_particles():
-            particle.velocity += particle.acceleration * (self.delta_time / 2)
-        t2 = time()
+        self.record_phase('cell_rebuild', t)
+        self.compute_accelerations_and_potentials(particles)
+        t = perf_counter_ns()
+        self.kick(particles)
+        self.record_phase('kick', t)
+        self.finish_iteration(particles)
+
         if log_time:
-            print(f'Total={t2 - t1}. Acceleration = {t_after - t_before}, F1 = {t11 - t1}, F2 = {t_before - t11}')
+            phases = ', '.join(f'{phase} = {duration / 1e6:.3f} ms' for phase, duration in self.phase_times.items())
+            print(f'Total = {sum(self.phase_times.values()) / 1e6:.3f} ms. {phases}')
+
+    def record_phase(self, phase: str, start: int):
+        end = perf_counter_ns()
+        self.phase_times[phase] = self.phase_times.get(phase, 0) + end - start
+        if self.instrumentation is not None:
+            self.instrumentation.record(phase, start, end)
+        return end
+
+    def translate(self, particles: ParticlesCells):
+        # x += v dt + a dt^2 / 2 and the first half kick; the compiled version also wraps positions
+        state = particles.arrays
+        if self.jit_compiled:
+            numba_backend.translate_and_kick(state.positions, state.velocities, state.accelerations, self.delta_time, self.box)
+        else:
+            state.positions += state.velocities * self.delta_time + state.accelerations * (self.delta_time ** 2 / 2)
+            state.velocities += state.accelerations * (self.delta_time / 2)
+
+    def kick(self, particles: ParticlesCells):
+        state = particles.arrays
+        if self.jit_compiled:
+            numba_backend.kick(state.velocities, state.accelerations, self.delta_time)
+        else:
+            state.velocities += state.accelerations * (self.delta_time / 2)
+
+    def finish_iteration(self, particles: ParticlesCells, time_step: float = None):
+        # time_step is the simulated time the step covered, when it is not delta_time (integrators.RESPA)
+        t = perf_counter_ns()
+        if self.stages:
+            for stage in self.stages:
+                stage.apply(self, particles, self.delta_time if time_step is None else time_step)
+            t = self.record_phase('stages', t)
+        particles.iteration_index += 1
+        if self.observer_bus is not None:
+            self.observer_bus.publish(particles)
+        self.record_phase('observers', t)
+
+    def compute_accelerations_and_potentials(self, particles: ParticlesCells):
+        t = perf_counter_ns()
+        state = particles.arrays
+
+        if self.backend == 'python':
+            self.drop_acceleration_and_potential(particles)
+            self.pairs_count = 0
+            self.pairs_inside_count = 0
+            state.virial = 0.0
+            for particle1, particle2 in particles.iterate_throw_particle_pairs():
+                virial = self.recompute_acceleration_and_potential(particle1, particle2)
+                self.pairs_count += 1
+                if virial is not None:
+                    state.virial += virial
+                    self.pairs_inside_count += 1
+            self.record_phase('force_kernel', t)
+        elif self.workers and self.workers > 1:
+            if self.domain_decomposition is None:
+                # multiprocessing and shared memory are only imported by runs that use workers
+                from parallel_forces import DomainDecomposition
+                self.domain_decomposition = DomainDecomposition(particles, self.workers, potential=self.potential)
+            (state.accelerations, state.potentials, state.virial,
+             self.pairs_inside_count, self.pairs_count) = self.domain_decomposition.compute(
+                particles, self.box, self.cut_off_distance
+            )
+            self.record_phase('force_kernel', t)
+        else:
+            index_i, index_j = particles.pair_indices()
+            self.pairs_count = len(index_i)
+            t = self.record_phase('pair_generation', t)
+
+            if self.jit_compiled:
+                state.accelerations, state.potentials, state.virial, self.pairs_inside_count = numba_backend.lennard_jones_forces(
+                    state.positions, self.box, index_i, index_j, self.cut_off_distance,
+                    parallel=(self.backend == 'numba_parallel')
+                )
+            else:
+                state.accelerations, state.potentials, state.virial, self.pairs_inside_count = pair_forces(
+                    state.positions, self.box, index_i, index_j, self.cut_off_distance, self.potential
+                )
+            self.record_phase('force_kernel', t)
+
+        if self.instrumentation is not None:
+            self.instrumentation.count('pairs_evaluated', self.pairs_count)
+            self.instrumentation.count('pairs_inside_cut_off', self.pairs_inside_count)
+
+    def rescale_box(self, particles: ParticlesCells, scale):
+        # Scales the box and the positions with it by a factor per axis (or one for all), keeping the cell grid in step
+        scale = np.broadcast_to(np.asarray(scale, dtype=float), self.box.shape)
+        particles.arrays.positions *= scale
+        box = self.box * scale
+        self.width, self.height = float(box[0]), float(box[1])
+        if self.depth is not None:
+            self.depth = float(box[2])
+        cells_count = particles.cells_count
+        particles.resize(self.width, self.height, self.depth)
+        # Worker processes share arrays sized for the old grid
+        if self.domain_decomposition is not None and particles.cells_count != cells_count:
+            self.domain_decomposition.close()
+            self.domain_decomposition = None
+
+    def close(self):
+        if self.domain_decomposition is not None:
+            self.domain_decomposition.close()
+            self.domain_decomposition = None
 
     def recompute_acceleration_and_potential(self, particle_i: Particle, particle_j: Particle):
         radius_i_j = particle_j.center - particle_i.center
 
-        if abs(radius_i_j.x) > (self.width / 2):
-            radius_i_j.x = -(self.width - abs(radius_i_j.x)) * np.sign(radius_i_j.x)
-        if abs(radius_i_j.y) > (self.height / 2):
-            radius_i_j.y = -(self.height - abs(radius_i_j.y)) * np.sign(radius_i_j.y)
-        radius_i_j_scalar = abs(radius_i_j)
+        for d, length in enumerate(self.box):
+            if abs(radius_i_j.coordinates[d]) > (length / 2):
+                radius_i_j.coordinates[d] = -(length - abs(radius_i_j.coordinates[d])) * np.sign(radius_i_j.coordinates[d])
+        distance_squared = float(radius_i_j.coordinates @ radius_i_j.coordinates)
 
-        if radius_i_j_scalar < self.cut_off_distance:
-            radius_i_j_inverted = 1 / radius_i_j_scalar
-            acceleration_i_j = radius_i_j * (-48 * ((radius_i_j_inverted ** 14) - 0.5 * (radius_i_j_inverted ** 8)))
-            potential_i_j = 4 * (radius_i_j_inverted**12 - radius_i_j_inverted**6)
+        if distance_squared < self.cut_off_distance ** 2:
+            potential_i_j, force_over_r = self.potential(distance_squared)
+            acceleration_i_j = radius_i_j * -float(force_over_r)
 
             particle_i.acceleration += acceleration_i_j
             particle_j.acceleration -= acceleration_i_j
 
-            particle_i.potential += potential_i_j
-            particle_j.potential += potential_i_j
+            particle_i.potential += float(potential_i_j)
+            particle_j.potential += float(potential_i_j)
+
+            return float(force_over_r) * distance_squared
+        return None
 
     def drop_acceleration_and_potential(self, particles: ParticlesCells):
-        for p in particles.iterate_throw_particles():
-            p.acceleration = Vector2D()
-            p.potential = 0.0
+        particles.arrays.accelerations[:] = 0.0
+        particles.arrays.potentials[:] = 0.0
 
 
-def get_width_height(particles_count, density):
-    length = (particles_count / density) ** 0.5
-    return (length, length)
+def get_width_height(particles_count, density, dimensions=2):
+    # Side lengths of a square (or cubic) box with the given number density
+    length = (particles_count / density) ** (1 / dimensions)
+    return (length,) * dimensions
 
 
 def calculate_center_of_mass_velocity(particles: ParticlesCells):
     # P = M*Vc
-    total_momentum = sum([np.multiply(p.velocity.coordinates, p.mass) for p in particles.iterate_throw_particles()])
-    total_mass = sum([p.mass for p in particles.iterate_throw_particles()])
+    state = particles.arrays
+    total_momentum = np.sum(state.velocities * state.masses[:, np.newaxis], axis=0)
+    total_mass = np.sum(state.masses)
 
     return total_momentum * (1 / total_mass)
\ No newline at end of file
@@ -0,0 +1,107 @@
+import os
+import json
+import glob
+import random
+import numpy as np
+from particle_arrays import ParticleArrays
+from particles_factory import ParticlesCells
+
+ARRAY_FIELDS = ('positions', 'velocities', 'accelerations', 'potentials', 'masses', 'radii', 'ids')
+CELL_FIELDS = ('cell_ids', 'permutation', 'cell_start', 'reference_positions', 'reference_box')
+
+
+def save_checkpoint(file_path, particles: ParticlesCells, calculator, rng: np.random.Generator = None):
+    state = particles.arrays
+    data = {field: getattr(state, field) for field in ARRAY_FIELDS}
+    # None colors are stored as -1 rows
+    data['colors'] = np.array([color if color else (-1, -1, -1) for color in state.colors], dtype=int).reshape(-1, 3)
+
+    # Cell and Verlet list state, so the pair order and the next rebuild are the same as without the restart
+    data.update({field: getattr(particles, field) for field in CELL_FIELDS if getattr(particles, field) is not None})
+    if particles.verlet_pairs is not None:
+        data['verlet_i'], data['verlet_j'] = particles.verlet_pairs
+
+    metadata = {
+        'width': particles.width,
+        'height': particles.height,
+        'depth': particles.depth,
+        'cut_off_distance': particles.cut_off_distance,
+        'skin': particles.skin,
+        'cells_per_cut_off': particles.cells_per_cut_off,
+        'iteration_index': particles.iteration_index,
+        'updates_count': particles.updates_count,
+        'rebuilds_count': particles.rebuilds_count,
+        'virial': state.virial,
+        'delta_time': calculator.delta_time,
+        'random_state': random.getstate(),
+        'rng_state': rng.bit_generator.state if rng is not None else None,
+        # State of integrators carrying some across steps, e.g. integrators.AdaptiveTimeStep
+        'integrator_state': calculator.integrator.state() if hasattr(calculator.integrator, 'state') else None,
+    }
+    data['metadata'] = np.array(json.dumps(metadata))
+
+    # Written next to the target and renamed over it, so a crash never leaves a torn checkpoint
+    temporary_path = f'{file_path}.tmp'
+    with open(temporary_path, 'wb') as file:
+        np.savez(file, **data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, file_path)
+
+
+def load_checkpoint(file_path, rng: np.random.Generator = None):
+    with np.load(file_path) as data:
+        metadata = json.loads(str(data['metadata']))
+
+        state = ParticleArrays(len(data['ids']), data['positions'].shape[1])
+        for field in ARRAY_FIELDS:
+            setattr(state, field, data[field].copy())
+        state.colors = [tuple(color) if color[0] >= 0 else None for color in data['colors'].tolist()]
+        state.virial = metadata['virial']
+
+        particles = ParticlesCells(metadata['width'], metadata['height'], metadata['cut_off_distance'], metadata['skin'],
+                                   metadata.get('depth'), metadata.get('cells_per_cut_off', 1))
+        particles.arrays = state
+        for field in CELL_FIELDS:
+            if field in data:
+                setattr(particles, field, data[field].copy())
+        if 'verlet_i' in data:
+            particles.verlet_pairs = (data['verlet_i'].copy(), data['verlet_j'].copy())
+
+    particles.iteration_index = metadata['iteration_index']
+    particles.updates_count = metadata['updates_count']
+    particles.rebuilds_count = metadata['rebuilds_count']
+
+    version, internal_state, gauss_next = metadata['random_state']
+    random.setstate((version, tuple(internal_state), gauss_next))
+    if rng is not None and metadata['rng_state'] is not None:
+        rng.bit_generator.state = metadata['rng_state']
+
+    return particles, metadata
+
+
+def latest_checkpoint(directory):
+    checkpoints = sorted(glob.glob(os.path.join(directory, 'checkpoint_*.npz')))
+    return checkpoints[-1] if checkpoints else None
+
+
+class Checkpointer:
+    # Observer writing checkpoint_<iteration>.npz on every call and keeping the `keep` latest ones
+    def __init__(self, directory, calculator, keep=3, rng: np.random.Generator = None):
+        if keep < 1:
+            raise ValueError(f'keep must be at least 1, got {keep}')
+        self.directory = directory
+        self.calculator = calculator
+        self.keep = keep
+        self.rng = rng
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def log_particles(self, particles: ParticlesCells):
+        file_path = os.path.join(self.directory, f'checkpoint_{particles.iteration_index:012d}.npz')
+        save_checkpoint(file_path, particles, self.calculator, self.rng)
+
+        checkpoints = sorted(glob.glob(os.path.join(self.directory, 'checkpoint_*.npz')))
+        for old_checkpoint in checkpoints[:-self.keep]:
+            os.remove(old_checkpoint)
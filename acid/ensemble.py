@@ -0,0 +1,200 @@
+import argparse
+import random
+import numpy as np
+from time import perf_counter
+from calculator import get_width_height, calculate_center_of_mass_velocity
+from particles_factory import ParticlesCells, make_particles, cell_pairs_to_particle_pairs
+from particle_arrays import ParticleArrays
+from forces import pair_forces
+from potentials import LennardJones
+from observables import Observables
+
+
+# R independent replicas with the same particle count stacked into (R, N, d) arrays. Every replica has
+# its own box, dt and seed, while cell lists, forces and integration run once per step for the whole batch.
+class Ensemble:
+    def __init__(self, replicas, cut_off_distance=2.5, **kwargs):
+        # replicas: ParticlesCells of equal length, their boxes and cut-off are taken as they are
+        self.cut_off_distance = cut_off_distance
+        self.replicas_count = len(replicas)
+        self.particles_count = len(replicas[0].arrays)
+        if any(len(replica.arrays) != self.particles_count for replica in replicas):
+            raise ValueError('All replicas must have the same number of particles')
+
+        self.positions = np.stack([replica.arrays.positions for replica in replicas])
+        self.velocities = np.stack([replica.arrays.velocities for replica in replicas])
+        self.accelerations = np.zeros_like(self.positions)
+        self.potentials = np.zeros(self.positions.shape[:2])
+        self.masses = np.stack([replica.arrays.masses for replica in replicas])
+        self.virials = np.zeros(self.replicas_count)
+
+        self.boxes = np.stack([replica.box for replica in replicas])
+        self.delta_times = np.broadcast_to(np.asarray(kwargs.get('delta_times', 0.001), dtype=float),
+                                           (self.replicas_count,)).copy()
+        self.iteration_index = 0
+        self.pairs_count = 0
+        self.chunk_pairs = kwargs.get('chunk_pairs', 16384)
+        self.potential = kwargs.get('potential', LennardJones())
+
+        self.observables = Observables(kwargs.get('capacity', 100000), kwargs.get('stride', 1), shape=(self.replicas_count,))
+
+        # One global cell grid: the cells of replica r are numbered from cell_offsets[r]
+        self.cells_per_axis = np.stack([replica.cells_per_axis for replica in replicas])
+        self.cell_strides = np.stack([replica.cell_strides for replica in replicas])
+        cells_counts = [replica.cells_count for replica in replicas]
+        self.cell_offsets = np.concatenate(([0], np.cumsum(cells_counts)))
+        self.neighbor_cells = tuple(
+            np.concatenate([cells + offset for cells, offset in zip(neighbor_cells, self.cell_offsets)])
+            for neighbor_cells in zip(*(replica.neighbor_cells for replica in replicas))
+        )
+        self.cell_start = np.zeros(self.cell_offsets[-1] + 1, dtype=int)
+        self.permutation = np.zeros(0, dtype=int)
+
+        self.update_cells()
+        self.compute_accelerations_and_potentials()
+
+    def __len__(self):
+        return self.replicas_count
+
+    def update_cells(self):
+        cells_per_axis = self.cells_per_axis[:, np.newaxis, :]
+        cell_indices = np.minimum((self.positions * (cells_per_axis / self.boxes[:, np.newaxis, :])).astype(int), cells_per_axis - 1)
+        cell_ids = (self.cell_offsets[:-1, np.newaxis] + np.einsum('rnd,rd->rn', cell_indices, self.cell_strides)).ravel()
+
+        counts = np.bincount(cell_ids, minlength=self.cell_offsets[-1])
+        self.cell_start = np.concatenate(([0], np.cumsum(counts)))
+        self.permutation = np.argsort(cell_ids, kind='stable')
+
+    def compute_accelerations_and_potentials(self):
+        # Pairs never cross replicas since neighbour cells never do; global index = r * N + i
+        index_i, index_j = cell_pairs_to_particle_pairs(self.cell_start, self.permutation, *self.neighbor_cells)
+        self.pairs_count = len(index_i)
+        pair_replicas = index_i // self.particles_count
+
+        # Pairs come ordered by replica; the kernel runs on runs of whole replicas of about chunk_pairs pairs,
+        # which keeps its temporaries in cache and lets every chunk write its own slice of the results
+        replica_starts = np.searchsorted(pair_replicas, np.arange(self.replicas_count + 1))
+        chunk_ids = replica_starts[:-1] // self.chunk_pairs
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(chunk_ids)) + 1, [self.replicas_count]))
+
+        positions = self.positions.reshape(-1, self.positions.shape[2])
+        accelerations = self.accelerations.reshape(positions.shape)
+        potentials = self.potentials.reshape(-1)
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            pairs = slice(replica_starts[first], replica_starts[last])
+            particles = slice(first * self.particles_count, last * self.particles_count)
+            offset = particles.start
+            accelerations[particles], potentials[particles], self.virials[first:last], _ = pair_forces(
+                positions[particles], self.boxes[pair_replicas[pairs]], index_i[pairs] - offset, index_j[pairs] - offset,
+                self.cut_off_distance, self.potential, pair_groups=pair_replicas[pairs] - first, groups_count=last - first
+            )
+
+    def iteration(self):
+        # Velocity Verlet as in Calculator.iteration_2, dt broadcast per replica
+        delta_times = self.delta_times[:, np.newaxis, np.newaxis]
+        self.positions += self.velocities * delta_times + self.accelerations * (delta_times ** 2 / 2)
+        self.velocities += self.accelerations * (delta_times / 2)
+        self.positions %= self.boxes[:, np.newaxis, :]
+
+        self.update_cells()
+        self.compute_accelerations_and_potentials()
+        self.velocities += self.accelerations * (delta_times / 2)
+        self.iteration_index += 1
+
+        if self.iteration_index % self.observables.stride == 0:
+            self.observables.append(**self.measure())
+
+    def run(self, n_steps):
+        for _ in range(n_steps):
+            self.iteration()
+
+    def measure(self):
+        # Observables.measure for every replica at once, each value is an array of length R
+        number, dimensions = self.positions.shape[1:]
+        volumes = np.prod(self.boxes, axis=1)
+
+        momentum = np.einsum('ri,rij->rj', self.masses, self.velocities)
+        kinetic_energy = 0.5 * np.einsum('ri,rij,rij->r', self.masses, self.velocities, self.velocities)
+        potential_energy = 0.5 * np.sum(self.potentials, axis=1)
+
+        temperature = 2 * kinetic_energy / (dimensions * max(number - 1, 1))
+        pressure = (number * temperature + self.virials / dimensions) / volumes
+
+        return {
+            'kinetic_energy': kinetic_energy / number,
+            'potential_energy': potential_energy / number,
+            'total_energy': (kinetic_energy + potential_energy) / number,
+            'temperature': temperature,
+            'momentum': np.linalg.norm(momentum, axis=1),
+            'pressure': pressure,
+        }
+
+    def depth(self, index):
+        return self.boxes[index][2] if self.boxes.shape[1] == 3 else None
+
+    def replica(self, index):
+        # ParticlesCells whose arrays are views onto replica index, for trajectory writers, painters and checkpoints
+        particles = ParticlesCells(*self.boxes[index][:2], self.cut_off_distance, depth=self.depth(index))
+        arrays = ParticleArrays(self.particles_count, self.positions.shape[2])
+        arrays.positions = self.positions[index]
+        arrays.velocities = self.velocities[index]
+        arrays.accelerations = self.accelerations[index]
+        arrays.potentials = self.potentials[index]
+        arrays.masses = self.masses[index]
+        arrays.virial = self.virials[index]
+        particles.update_cells(arrays)
+        particles.iteration_index = self.iteration_index
+        return particles
+
+
+def make_ensemble(particles_count, densities, cut_off_distance, velocity_muls=0, delta_times=0.001, seeds=None,
+                  dimensions=2, **kwargs):
+    # One replica per density; velocity_muls, delta_times and seeds are scalars or one value per replica
+    replicas_count = len(densities)
+    velocity_muls = np.broadcast_to(velocity_muls, (replicas_count,))
+    seeds = range(replicas_count) if seeds is None else seeds
+
+    replicas = []
+    for density, velocity_mul, seed in zip(densities, velocity_muls, seeds):
+        random.seed(seed)
+        width, height, *depth = get_width_height(particles_count, density, dimensions)
+        particles = make_particles(width, height, particles_count, cut_off_distance, velocity_mul=velocity_mul,
+                                   depth=depth[0] if depth else None)
+        particles.arrays.velocities -= calculate_center_of_mass_velocity(particles)
+        replicas.append(particles)
+
+    return Ensemble(replicas, cut_off_distance, delta_times=delta_times, **kwargs)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Run independent Lennard-Jones replicas as one batch')
+    parser.add_argument('--particles', type=int, default=100)
+    parser.add_argument('--densities', type=float, nargs='+', default=[0.81])
+    parser.add_argument('--dimensions', type=int, default=2, choices=[2, 3])
+    parser.add_argument('--velocity-muls', type=float, nargs='+', default=[16])
+    parser.add_argument('--delta-times', type=float, nargs='+', default=[0.001])
+    parser.add_argument('--seeds', type=int, nargs='+', default=None)
+    parser.add_argument('--cut-off-distance', type=float, default=2.5)
+    parser.add_argument('--steps', type=int, default=1000)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    ensemble = make_ensemble(arguments.particles, arguments.densities, arguments.cut_off_distance,
+                             velocity_muls=arguments.velocity_muls, delta_times=arguments.delta_times,
+                             seeds=arguments.seeds, dimensions=arguments.dimensions, stride=max(arguments.steps // 100, 1))
+
+    t1 = perf_counter()
+    ensemble.run(arguments.steps)
+    elapsed = perf_counter() - t1
+
+    print(f'{arguments.steps} steps of {len(ensemble)} x {ensemble.particles_count} particles in {elapsed:.3f}s: '
+          f'{arguments.steps * len(ensemble) / elapsed:.1f} replica steps/s')
+    values = ensemble.measure()
+    for index, density in enumerate(arguments.densities):
+        print(f'density = {density:g}: ' + ', '.join(f'{field} = {value[index]:.6g}' for field, value in values.items()))
+
+
+if __name__ == '__main__':
+    main()
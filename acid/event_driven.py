@@ -0,0 +1,214 @@
+import heapq
+import math
+import numpy as np
+
+PAIR, WALL, CELL = 0, 1, 2
+
+
+# Event-driven hard spheres in a walled box, next to the time-stepped matplotlib_painter.ParticleBox.
+# Particles fly freely between events; pair collisions, wall hits and cell crossings are predicted and kept
+# in a heap. An event carries the collision counters of its particles at prediction time and is skipped
+# when one of them has changed since (lazy invalidation). Particles keep their own clock, so an event only
+# touches the particles involved: one pop plus predictions against the 3x3 neighbour cells, O(log N).
+# The per-event work is a handful of scalars, which plain Python floats handle faster than numpy.
+class EventDrivenBox:
+    def __init__(self, init_state, bounds=(-2, 2, -2, 2), size=0.04, M=0.05):
+        # init_state and bounds as in ParticleBox: rows of [x, y, vx, vy], box is [xmin, xmax, ymin, ymax]
+        init_state = np.asarray(init_state, dtype=float)
+        particles_count = init_state.shape[0]
+        self.bounds = bounds
+        self.size = size
+        self.origin = (float(bounds[0]), float(bounds[2]))
+        self.width = float(bounds[1] - bounds[0])
+        self.height = float(bounds[3] - bounds[2])
+        self.M = M * np.ones(particles_count)
+        self.masses = self.M.tolist()
+
+        # Positions are relative to the origin and valid at the particle's own clock
+        self.x = (init_state[:, 0] - self.origin[0]).tolist()
+        self.y = (init_state[:, 1] - self.origin[1]).tolist()
+        self.vx = init_state[:, 2].tolist()
+        self.vy = init_state[:, 3].tolist()
+        self.clocks = [0.0] * particles_count
+        self.time_elapsed = 0.0
+
+        self.counts = [0] * particles_count
+        self.collisions_count = 0
+        self.wall_collisions_count = 0
+        self.cell_crossings_count = 0
+        self.stale_events_count = 0
+
+        # Spheres only touch in adjacent cells, so cells are at least one diameter wide;
+        # about one particle per cell balances neighbour checks against crossing events
+        cell_length = max(2 * size, math.sqrt(self.width * self.height / max(particles_count, 1)))
+        self.cols_count = max(int(self.width / cell_length), 1)
+        self.rows_count = max(int(self.height / cell_length), 1)
+        self.cell_width = self.width / self.cols_count
+        self.cell_height = self.height / self.rows_count
+        self.cell_of = [
+            (min(max(int(x / self.cell_width), 0), self.cols_count - 1), min(max(int(y / self.cell_height), 0), self.rows_count - 1))
+            for x, y in zip(self.x, self.y)
+        ]
+        self.cells = {}
+        for i, cell in enumerate(self.cell_of):
+            self.cells.setdefault(cell, set()).add(i)
+
+        self.events = []
+        self.events_sequence = 0
+        for i in range(particles_count):
+            self.predict(i, partners_below=i)
+
+    @property
+    def state(self):
+        # ParticleBox layout at the current time
+        self.synchronize()
+        return np.column_stack([np.array(self.x) + self.origin[0], np.array(self.y) + self.origin[1], self.vx, self.vy])
+
+    @property
+    def velocities(self):
+        return np.column_stack([self.vx, self.vy])
+
+    def synchronize(self):
+        for i in range(len(self.x)):
+            self.move(i, self.time_elapsed)
+
+    def move(self, i, time):
+        elapsed = time - self.clocks[i]
+        self.x[i] += self.vx[i] * elapsed
+        self.y[i] += self.vy[i] * elapsed
+        self.clocks[i] = time
+
+    def neighbors(self, i):
+        cell_x, cell_y = self.cell_of[i]
+        cells = self.cells
+        for x in range(max(cell_x - 1, 0), min(cell_x + 2, self.cols_count)):
+            for y in range(max(cell_y - 1, 0), min(cell_y + 2, self.rows_count)):
+                yield from cells.get((x, y), ())
+
+    def push(self, time, kind, i, j):
+        count_j = self.counts[j] if kind == PAIR else 0
+        heapq.heappush(self.events, (time, self.events_sequence, kind, i, j, self.counts[i], count_j))
+        self.events_sequence += 1
+
+    def predict(self, i, partners_below=None):
+        # Next wall hit, next cell crossing and collisions with the neighbours of i, all from time_elapsed on.
+        # partners_below limits pairs to j < i during set up so every pair is predicted once
+        now = self.time_elapsed
+        self.move(i, now)
+        x, y, vx, vy = self.x[i], self.y[i], self.vx[i], self.vy[i]
+        cell_x, cell_y = self.cell_of[i]
+
+        # Wall hits on axis 0 (x) and 1 (y)
+        wall_time, wall_axis = math.inf, None
+        for axis, position, velocity, length in ((0, x, vx, self.width), (1, y, vy, self.height)):
+            if velocity > 0:
+                time = (length - self.size - position) / velocity
+            elif velocity < 0:
+                time = (self.size - position) / velocity
+            else:
+                continue
+            if time < wall_time:
+                wall_time, wall_axis = time, axis
+        if wall_axis is not None:
+            self.push(now + max(wall_time, 0.0), WALL, i, wall_axis)
+
+        # Crossings into the next cell; cells beyond the walls are never entered
+        crossing_time, crossing_axis = math.inf, None
+        for axis, position, velocity, cell, cells_count, cell_length in (
+            (0, x, vx, cell_x, self.cols_count, self.cell_width),
+            (1, y, vy, cell_y, self.rows_count, self.cell_height),
+        ):
+            if velocity > 0 and cell < cells_count - 1:
+                time = ((cell + 1) * cell_length - position) / velocity
+            elif velocity < 0 and cell > 0:
+                time = (cell * cell_length - position) / velocity
+            else:
+                continue
+            if time < crossing_time:
+                crossing_time, crossing_axis = time, axis
+        if crossing_axis is not None:
+            self.push(now + max(crossing_time, 0.0), CELL, i, crossing_axis)
+
+        diameter_squared = (2 * self.size) ** 2
+        for j in self.neighbors(i):
+            if j == i or (partners_below is not None and j >= partners_below):
+                continue
+            elapsed = now - self.clocks[j]
+            dx = x - (self.x[j] + self.vx[j] * elapsed)
+            dy = y - (self.y[j] + self.vy[j] * elapsed)
+            dvx = vx - self.vx[j]
+            dvy = vy - self.vy[j]
+            b = dx * dvx + dy * dvy
+            if b >= 0:
+                continue
+            vv = dvx * dvx + dvy * dvy
+            discriminant = b * b - vv * (dx * dx + dy * dy - diameter_squared)
+            # Approaching pairs whose paths come within one diameter
+            if discriminant > 0:
+                self.push(now + max(-(b + math.sqrt(discriminant)) / vv, 0.0), PAIR, i, j)
+
+    def advance(self, duration):
+        # Processes every event up to time_elapsed + duration and leaves all particles at that time
+        end = self.time_elapsed + duration
+        events, counts = self.events, self.counts
+        while events and events[0][0] <= end:
+            time, _, kind, i, j, count_i, count_j = heapq.heappop(events)
+            if count_i != counts[i] or (kind == PAIR and count_j != counts[j]):
+                self.stale_events_count += 1
+                continue
+
+            self.time_elapsed = time
+            if kind == PAIR:
+                self.collide(i, j, time)
+                self.predict(i)
+                self.predict(j)
+            elif kind == WALL:
+                self.move(i, time)
+                if j == 0:
+                    self.vx[i] = -self.vx[i]
+                else:
+                    self.vy[i] = -self.vy[i]
+                counts[i] += 1
+                self.wall_collisions_count += 1
+                self.predict(i)
+            else:
+                self.cross(i, j, time)
+                self.predict(i)
+
+        self.time_elapsed = end
+        self.synchronize()
+
+    def step(self, dt):
+        # ParticleBox interface for the animation
+        self.advance(dt)
+
+    def collide(self, i, j, time):
+        self.move(i, time)
+        self.move(j, time)
+        dx, dy = self.x[i] - self.x[j], self.y[i] - self.y[j]
+        dvx, dvy = self.vx[i] - self.vx[j], self.vy[i] - self.vy[j]
+        m1, m2 = self.masses[i], self.masses[j]
+
+        # Elastic collision: the component of v_rel along r_rel is reversed, shared by the mass ratio
+        factor = 2 * (dvx * dx + dvy * dy) / (dx * dx + dy * dy) / (m1 + m2)
+        self.vx[i] -= factor * dx * m2
+        self.vy[i] -= factor * dy * m2
+        self.vx[j] += factor * dx * m1
+        self.vy[j] += factor * dy * m1
+        self.counts[i] += 1
+        self.counts[j] += 1
+        self.collisions_count += 1
+
+    def cross(self, i, axis, time):
+        # A new cell brings new neighbours, so i is predicted again from scratch
+        self.move(i, time)
+        cell_x, cell_y = self.cell_of[i]
+        if axis == 0:
+            cell_x += 1 if self.vx[i] > 0 else -1
+        else:
+            cell_y += 1 if self.vy[i] > 0 else -1
+        self.cells[self.cell_of[i]].discard(i)
+        self.cell_of[i] = (cell_x, cell_y)
+        self.cells.setdefault(self.cell_of[i], set()).add(i)
+        self.counts[i] += 1
+        self.cell_crossings_count += 1
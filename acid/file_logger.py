@@ -1,5 +1,6 @@
 import os
 import datetime
+import numpy as np
 from particles_factory import ParticlesCells
 from particle import Particle
 
@@ -15,7 +16,9 @@ class FileLogger:
         self.file = open(self.file_path, 'w+')
 
     def log_particles(self, particles: ParticlesCells):
-        data = [str(p) + '\n' for p in particles.iterate_throw_particles()]
+        state = particles.arrays
+        table = np.column_stack([state.positions, state.velocities, state.accelerations, state.potentials])
+        data = [';'.join([str(id)] + [str(x) for x in row]) + '\n' for id, row in zip(state.ids.tolist(), table.tolist())]
         self.file.writelines(data)
 
     def dispose(self):
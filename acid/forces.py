@@ -0,0 +1,42 @@
+import numpy as np
+from potentials import PairPotential
+
+
+def minimum_image(radius_i_j: np.ndarray, box) -> np.ndarray:
+    box = np.asarray(box, dtype=float)
+    return np.where(np.abs(radius_i_j) > box / 2, radius_i_j - box * np.sign(radius_i_j), radius_i_j)
+
+
+def pair_forces(positions: np.ndarray, box, index_i: np.ndarray, index_j: np.ndarray, cut_off_distance: float,
+                potential: PairPotential, pair_groups: np.ndarray = None, groups_count: int = 1):
+    # One vectorized pass over all candidate pairs; results are scatter-added per particle.
+    # The virial sum(r_ij . f_ij) over pairs inside the cut-off comes along for pressure estimation.
+    # box may also be given per pair, and with pair_groups the virial is summed per group (see ensemble.Ensemble).
+    particles_count, dimensions = positions.shape
+    accelerations = np.zeros((particles_count, dimensions))
+    potentials = np.zeros(particles_count)
+
+    radius_i_j = minimum_image(positions[index_j] - positions[index_i], box)
+    distance_squared = np.einsum('ij,ij->i', radius_i_j, radius_i_j)
+
+    inside = distance_squared < cut_off_distance ** 2
+    index_i, index_j = index_i[inside], index_j[inside]
+    radius_i_j = radius_i_j[inside]
+    distance_squared = distance_squared[inside]
+
+    potential_i_j, force_over_r = potential(distance_squared)
+    acceleration_i_j = radius_i_j * -force_over_r[:, np.newaxis]
+    if pair_groups is None:
+        virial = np.sum(force_over_r * distance_squared)
+    else:
+        virial = np.bincount(pair_groups[inside], weights=force_over_r * distance_squared, minlength=groups_count)
+
+    for d in range(dimensions):
+        accelerations[:, d] = (
+            np.bincount(index_i, weights=acceleration_i_j[:, d], minlength=particles_count)
+            - np.bincount(index_j, weights=acceleration_i_j[:, d], minlength=particles_count)
+        )
+    potentials += np.bincount(index_i, weights=potential_i_j, minlength=particles_count)
+    potentials += np.bincount(index_j, weights=potential_i_j, minlength=particles_count)
+
+    return accelerations, potentials, virial, len(potential_i_j)
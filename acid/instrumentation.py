@@ -0,0 +1,76 @@
+import json
+import numpy as np
+from collections import deque
+from time import perf_counter_ns
+
+
+class Instrumentation:
+    def __init__(self, samples_count=1024, trace_events_count=0):
+        # Per phase: total and call count, plus a ring of the latest durations for percentiles
+        self.samples_count = samples_count
+        self.totals = {}
+        self.calls = {}
+        self.samples = {}
+        self.counters = {}
+
+        # Chrome trace events are only kept when asked for, bounded to the latest ones
+        self.trace_events = deque(maxlen=trace_events_count) if trace_events_count else None
+        self.origin = perf_counter_ns()
+
+    def record(self, phase, start, end=None):
+        end = perf_counter_ns() if end is None else end
+        duration = end - start
+
+        if phase not in self.totals:
+            self.totals[phase] = 0
+            self.calls[phase] = 0
+            self.samples[phase] = np.zeros(self.samples_count, dtype=np.int64)
+        self.samples[phase][self.calls[phase] % self.samples_count] = duration
+        self.totals[phase] += duration
+        self.calls[phase] += 1
+
+        if self.trace_events is not None:
+            self.trace_events.append((phase, start, duration))
+        return end
+
+    def count(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def percentiles(self, phase, quantiles=(50, 90, 99)):
+        samples = self.samples[phase][:min(self.calls[phase], self.samples_count)]
+        return dict(zip(quantiles, np.percentile(samples, quantiles).tolist()))
+
+    def summary(self):
+        return {
+            'phases': {
+                phase: {
+                    'calls': self.calls[phase],
+                    'total_ns': self.totals[phase],
+                    'mean_ns': self.totals[phase] / self.calls[phase],
+                    'percentiles_ns': {f'p{q}': value for q, value in self.percentiles(phase).items()},
+                }
+                for phase in self.totals
+            },
+            'counters': dict(self.counters),
+        }
+
+    def write_json(self, file_path):
+        with open(file_path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def write_chrome_trace(self, file_path):
+        # Complete ("X") events in microseconds, loadable in chrome://tracing or Perfetto
+        events = [
+            {'name': phase, 'ph': 'X', 'ts': (start - self.origin) / 1000, 'dur': duration / 1000, 'pid': 0, 'tid': 0}
+            for phase, start, duration in (self.trace_events or ())
+        ]
+        with open(file_path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+    def __str__(self):
+        lines = []
+        for phase, values in self.summary()['phases'].items():
+            percentiles = ', '.join(f'{name} = {value / 1e6:.3f}' for name, value in values['percentiles_ns'].items())
+            lines.append(f"{phase}: mean = {values['mean_ns'] / 1e6:.3f} ms, {percentiles} ms over {values['calls']} calls")
+        lines.extend(f'{counter}: {value}' for counter, value in self.counters.items())
+        return '\n'.join(lines)
@@ -0,0 +1,275 @@
+import numpy as np
+import warnings
+from time import perf_counter_ns
+from forces import pair_forces, minimum_image
+from potentials import Switched, continuous_at_cut_off
+from particles_factory import ParticlesCells
+
+
+# An integrator advances the particles by one step through Calculator.step and returns the simulated time
+# the step covered. calculator.delta_time is the (innermost) time step; integrators keep no copy of it,
+# so AdaptiveTimeStep can change it between steps.
+
+class VelocityVerlet:
+    # Drift with the half kick folded in, forces, half kick: Calculator.iteration_2
+    def step(self, calculator, particles: ParticlesCells, log_time=False):
+        delta_time = calculator.delta_time
+        calculator.iteration_2(particles, log_time)
+        return delta_time
+
+    def reset(self):
+        pass
+
+
+class LeapFrog:
+    # Kick-drift-kick leapfrog, velocities at whole steps: Calculator.iteration
+    def step(self, calculator, particles: ParticlesCells, log_time=False):
+        delta_time = calculator.delta_time
+        calculator.iteration(particles, log_time)
+        return delta_time
+
+    def reset(self):
+        pass
+
+
+class RESPA:
+    # Reversible multiple time stepping (Tuckerman, Berne, Martyna 1992). The potential is split with
+    # potentials.Switched around inner_cut_off: the steep short-range part is integrated with delta_time,
+    # the smooth long-range part only kicks once every inner_steps steps. One call is one outer step.
+    # Inner forces run over a Verlet list of pairs within inner_cut_off + margin taken from the cell list,
+    # rebuilt once someone moved margin / 2. Forces always go through the numpy kernel.
+    def __init__(self, inner_steps=4, inner_cut_off=1.5, switch_width=0.3, margin=0.3):
+        self.inner_steps = inner_steps
+        self.inner_cut_off = inner_cut_off
+        self.switch_width = switch_width
+        self.margin = margin
+
+        self.potential = None
+        self.inner_potential = None
+        self.outer_potential = None
+        self.reset()
+
+    def reset(self):
+        # Drops the cached forces, e.g. after the positions were changed from outside
+        self.inner_forces = None
+        self.outer_forces = None
+        self.inner_pairs = None
+        self.reference_positions = None
+        self.reference_box = None
+
+    def split(self, calculator):
+        if self.potential == calculator.potential:
+            return
+        if self.inner_cut_off + self.margin > calculator.cut_off_distance:
+            raise ValueError(f'inner_cut_off + margin must not exceed the cut-off {calculator.cut_off_distance}')
+        self.potential = calculator.potential
+        switch_start = self.inner_cut_off - self.switch_width
+        self.inner_potential = Switched(self.potential, switch_start, self.inner_cut_off, 'inner')
+        self.outer_potential = Switched(self.potential, switch_start, self.inner_cut_off, 'outer')
+        self.reset()
+
+    def update_inner_pairs(self, calculator, particles: ParticlesCells, index_i, index_j):
+        positions = particles.arrays.positions
+        radius_i_j = minimum_image(positions[index_j] - positions[index_i], calculator.box)
+        close = np.einsum('ij,ij->i', radius_i_j, radius_i_j) < (self.inner_cut_off + self.margin) ** 2
+        self.inner_pairs = (index_i[close], index_j[close])
+        self.reference_positions = positions.copy()
+        self.reference_box = calculator.box
+
+    def inner_pairs_valid(self, calculator, particles: ParticlesCells):
+        # As ParticlesCells.needs_rebuild, including boxes rescaled by a barostat since the list was made
+        box = calculator.box
+        scale = box / self.reference_box
+        shrink = min(np.min(scale), 1.0)
+        allowed = self.margin / 2 if shrink == 1.0 else (shrink * (self.inner_cut_off + self.margin) - self.inner_cut_off) / 2
+        if allowed <= 0:
+            return False
+        displacement = minimum_image(particles.arrays.positions - self.reference_positions * scale, box)
+        return np.max(np.einsum('ij,ij->i', displacement, displacement), initial=0.0) <= allowed ** 2
+
+    def compute_inner(self, calculator, particles: ParticlesCells):
+        t = perf_counter_ns()
+        if self.inner_pairs is None or not self.inner_pairs_valid(calculator, particles):
+            particles.update_cells()
+            self.update_inner_pairs(calculator, particles, *particles.pair_indices())
+            t = calculator.record_phase('pair_generation', t)
+        self.inner_forces = pair_forces(particles.arrays.positions, calculator.box, *self.inner_pairs,
+                                        self.inner_cut_off, self.inner_potential)
+        calculator.record_phase('force_kernel', t)
+
+    def compute_outer(self, calculator, particles: ParticlesCells):
+        t = perf_counter_ns()
+        particles.update_cells()
+        index_i, index_j = particles.pair_indices()
+        calculator.pairs_count = len(index_i)
+        t = calculator.record_phase('pair_generation', t)
+        self.outer_forces = pair_forces(particles.arrays.positions, calculator.box, index_i, index_j,
+                                        calculator.cut_off_distance, self.outer_potential)
+        calculator.pairs_inside_count = self.outer_forces[3]
+        t = calculator.record_phase('force_kernel', t)
+        # The fresh cell list also refreshes the inner pairs at no extra cost
+        self.update_inner_pairs(calculator, particles, index_i, index_j)
+        calculator.record_phase('pair_generation', t)
+
+    def step(self, calculator, particles: ParticlesCells, log_time=False):
+        self.split(calculator)
+        calculator.phase_times = {}
+        state = particles.arrays
+        delta_time = calculator.delta_time
+        outer_delta_time = delta_time * self.inner_steps
+        if self.outer_forces is None:
+            self.compute_outer(calculator, particles)
+            self.compute_inner(calculator, particles)
+
+        t = perf_counter_ns()
+        state.velocities += self.outer_forces[0] * (outer_delta_time / 2)
+        calculator.record_phase('kick', t)
+        for _ in range(self.inner_steps):
+            t = perf_counter_ns()
+            state.velocities += self.inner_forces[0] * (delta_time / 2)
+            state.positions += state.velocities * delta_time
+            calculator.limit_condition_periodic(state.positions)
+            calculator.record_phase('drift', t)
+            self.compute_inner(calculator, particles)
+            t = perf_counter_ns()
+            state.velocities += self.inner_forces[0] * (delta_time / 2)
+            calculator.record_phase('kick', t)
+        self.compute_outer(calculator, particles)
+        t = perf_counter_ns()
+        state.velocities += self.outer_forces[0] * (outer_delta_time / 2)
+        calculator.record_phase('kick', t)
+
+        # The two parts add up to the full potential, so observables see the usual totals
+        state.accelerations = self.inner_forces[0] + self.outer_forces[0]
+        state.potentials = self.inner_forces[1] + self.outer_forces[1]
+        state.virial = self.inner_forces[2] + self.outer_forces[2]
+        calculator.finish_iteration(particles, outer_delta_time)
+
+        if log_time:
+            phases = ', '.join(f'{phase} = {duration / 1e6:.3f} ms' for phase, duration in calculator.phase_times.items())
+            print(f'Total = {sum(calculator.phase_times.values()) / 1e6:.3f} ms. {phases}')
+        return outer_delta_time
+
+
+def total_energy(particles: ParticlesCells):
+    # Kinetic and potential energy of the whole system
+    state = particles.arrays
+    kinetic_energy = 0.5 * np.einsum('i,ij,ij->', state.masses, state.velocities, state.velocities)
+    return kinetic_energy, 0.5 * np.sum(state.potentials)
+
+
+class AdaptiveTimeStep:
+    # Picks calculator.delta_time online for the wrapped integrator. Before every step dt is capped so that no
+    # particle moves further than max_displacement, from the largest speed and force. After the step the
+    # energy change relative to the kinetic energy is compared with tolerance: above it dt shrinks at once,
+    # after calm_steps steps well below it dt grows, up to max_delta_time. A potential cut off with a jump, or
+    # stages such as thermostats, add energy changes dt cannot reduce, so there only the displacement cap bounds dt
+    # and the energy is just monitored.
+    def __init__(self, integrator=None, **kwargs):
+        self.integrator = integrator if integrator is not None else VelocityVerlet()
+        self.tolerance = kwargs.get('tolerance', 1e-4)
+        self.max_displacement = kwargs.get('max_displacement', 0.05)
+        self.min_delta_time = kwargs.get('min_delta_time', 1e-5)
+        self.max_delta_time = kwargs.get('max_delta_time', 0.01)
+        self.growth = kwargs.get('growth', 1.1)
+        self.shrink = kwargs.get('shrink', 0.5)
+        self.calm_steps = kwargs.get('calm_steps', 10)
+
+        # Whether the energy change steers dt, decided from the potential and the stages on the first step
+        self.energy_control = None
+        # Online monitor: energies are per particle, drift is (E - E0) / K since the first step
+        self.initial_energy = None
+        self.energy = None
+        self.energy_change = 0.0
+        self.drift = 0.0
+        self.max_force = 0.0
+        self.calm_count = 0
+        self.shrinks_count = 0
+        self.growths_count = 0
+
+    def reset(self):
+        self.integrator.reset()
+        self.energy = None
+
+    STATE_FIELDS = ('energy_control', 'initial_energy', 'energy', 'energy_change', 'drift', 'max_force',
+                    'calm_count', 'shrinks_count', 'growths_count')
+
+    def state(self):
+        # Controller and monitor state, JSON friendly, so a checkpointed run continues with the same dt sequence
+        return {field: getattr(self, field) for field in self.STATE_FIELDS}
+
+    def restore(self, state):
+        for field in self.STATE_FIELDS:
+            setattr(self, field, state[field])
+
+    def displacement_limit(self, particles: ParticlesCells):
+        # Largest dt with v dt + a dt^2 / 2 <= max_displacement for the fastest and the most pushed particle
+        state = particles.arrays
+        speed = np.sqrt(np.max(np.einsum('ij,ij->i', state.velocities, state.velocities), initial=0.0))
+        acceleration = np.sqrt(np.max(np.einsum('ij,ij->i', state.accelerations, state.accelerations), initial=0.0))
+        if acceleration == 0.0:
+            return self.max_delta_time if speed == 0.0 else self.max_displacement / speed
+        return (np.sqrt(speed ** 2 + 2 * acceleration * self.max_displacement) - speed) / acceleration
+
+    def step(self, calculator, particles: ParticlesCells, log_time=False):
+        if self.energy_control is None:
+            self.energy_control = continuous_at_cut_off(calculator.potential, calculator.cut_off_distance)
+            if not self.energy_control:
+                warnings.warn(f'{calculator.potential} jumps at the cut-off, the adaptive time step follows the '
+                              f'displacement cap only; use a shifted potential to control the energy change')
+            elif calculator.stages:
+                self.energy_control = False
+                warnings.warn('stages change the energy, the adaptive time step follows the displacement cap only')
+        if self.energy is not None:
+            calculator.delta_time = float(min(calculator.delta_time, self.displacement_limit(particles)))
+            calculator.delta_time = max(calculator.delta_time, self.min_delta_time)
+        time_step = self.integrator.step(calculator, particles, log_time)
+
+        state = particles.arrays
+        count = len(state)
+        self.max_force = float(np.sqrt(np.max(
+            np.einsum('ij,ij->i', state.accelerations, state.accelerations), initial=0.0
+        )) * np.max(state.masses, initial=0.0))
+        kinetic_energy, potential_energy = total_energy(particles)
+        energy = float(kinetic_energy + potential_energy) / count
+        kinetic_energy = max(float(kinetic_energy) / count, np.finfo(float).tiny)
+
+        # The first step only sets the reference: forces may not have been computed before it
+        if self.energy is None:
+            if self.initial_energy is None:
+                self.initial_energy = energy
+            self.energy = energy
+            return time_step
+
+        self.energy_change = abs(energy - self.energy) / kinetic_energy
+        self.drift = (energy - self.initial_energy) / kinetic_energy
+        self.energy = energy
+        if self.energy_control and self.energy_change > self.tolerance:
+            calculator.delta_time = max(calculator.delta_time * self.shrink, self.min_delta_time)
+            self.calm_count = 0
+            self.shrinks_count += 1
+        elif not self.energy_control or self.energy_change < self.tolerance / 4:
+            self.calm_count += 1
+            if self.calm_count >= self.calm_steps:
+                calculator.delta_time = min(calculator.delta_time * self.growth, self.max_delta_time)
+                self.calm_count = 0
+                self.growths_count += 1
+        else:
+            self.calm_count = 0
+        return time_step
+
+
+def make_integrator(name, adaptive=False, **kwargs):
+    # 'velocity_verlet', 'leapfrog' or 'respa' (kwargs go to RESPA), wrapped in AdaptiveTimeStep when asked;
+    # adaptive may be a dict of AdaptiveTimeStep options
+    integrators = {
+        'velocity_verlet': lambda: VelocityVerlet(),
+        'leapfrog': lambda: LeapFrog(),
+        'respa': lambda: RESPA(**kwargs),
+    }
+    if name not in integrators:
+        raise ValueError(f'Unknown integrator {name}')
+    integrator = integrators[name]()
+    if adaptive:
+        integrator = AdaptiveTimeStep(integrator, **(adaptive if isinstance(adaptive, dict) else {}))
+    return integrator
@@ -2,7 +2,8 @@ from board import Board
 from particle import Particle
 from vector import Vector2D
 from random import random
-from particles_factory import make_particles, load_particles_from_file
+from particles_factory import make_particles
+from checkpoint import load_checkpoint
 import calculator
 import sys
 
@@ -11,17 +12,21 @@ if __name__ == "__main__":
     particles_count = 100
     density = 0.81
     cut_off_distance = 1000
+    delta_time = 0.001
     width, height = calculator.get_width_height(particles_count, density)
-    print(width)
-    if ('old_state' in sys.argv):
-        particles = load_particles_from_file(width, height, cut_off_distance, 'last_particles_state.csv')
+    resume = 'old_state' in sys.argv
+    if resume:
+        particles, metadata = load_checkpoint('last_particles_state.npz')
+        width, height = metadata['width'], metadata['height']
+        cut_off_distance, delta_time = metadata['cut_off_distance'], metadata['delta_time']
     else:
         particles = make_particles(width, height, particles_count, cut_off_distance, velocity_mul=16)
+    print(width)
 
     parameteres = {
         'width': width,
         'height': width,
     }
 
-    board = Board(**parameteres, ticks_per_second=120, cut_off_distance=cut_off_distance, delta_time=0.001)
-    board.start(particles)
+    board = Board(**parameteres, ticks_per_second=120, cut_off_distance=cut_off_distance, delta_time=delta_time)
+    board.start(particles, remove_drift=not resume)
@@ -1,81 +1,118 @@
-from particle import Particle
-from vector import Vector2D
 from pygame_painter import PygamePainter
 from plot_logger import PlotLogger
+from trajectory import TrajectoryReader
+from itertools import islice
+from threading import Thread
+from queue import Queue
+import numpy as np
 import pygame
 import sys
 
 
+HIGHLIGHTED_PARTICLES = {
+    100: (255, 55, 55),
+    437: (55, 255, 55),
+    321: (55, 55, 255),
+}
+
+
+def iterate_text_frames(file, particles_number, frames_per_iteration):
+    # Decodes every frames_per_iteration-th block of particles_number lines, skipping the rest unparsed
+    while True:
+        lines = list(islice(file, particles_number))
+        if len(lines) < particles_number:
+            return
+
+        # frame_id, particle_id, cx, cy, potential, kinetic_energy
+        table = np.array(' '.join(lines).split(), dtype=float).reshape(particles_number, 6)
+        yield table[:, 1].astype(int), table[:, 2:4], table[:, 4], table[:, 5]
+
+        for _ in islice(file, particles_number * (frames_per_iteration - 1)):
+            pass
+
+
+def iterate_trajectory_frames(reader: TrajectoryReader, frames_per_iteration):
+    for frame in reader[::frames_per_iteration]:
+        kinetic_energy = np.sum(frame['velocities'] ** 2, axis=1) / 2
+        # Recorded potentials count every pair energy for both particles; half of them sum to the system's,
+        # as the per particle potentials of the text frames do
+        yield reader.ids, frame['positions'], 0.5 * frame['potentials'], kinetic_energy
+
+
+def prefetch(frames, size=4):
+    # Decodes on a background thread; the bounded queue keeps at most `size` frames in memory
+    queue = Queue(maxsize=size)
+    end = object()
+
+    def produce():
+        for frame in frames:
+            queue.put(frame)
+        queue.put(end)
+
+    Thread(target=produce, daemon=True).start()
+    while True:
+        frame = queue.get()
+        if frame is end:
+            return
+        yield frame
+
+
+def replay(frames, width, particles_number):
+    screen_width = 800
+    screen = pygame.display.set_mode((screen_width, screen_width))
+
+    scale = screen_width / width
+    painter = PygamePainter(screen, scale)
+    logger = PlotLogger()
+
+    clock = pygame.time.Clock()
+
+    colors = None
+    radii = np.full(particles_number, 0.5)
+    for particle_ids, positions, potentials, kinetic_energies in prefetch(frames):
+        clock.tick(120)
+        if any(event.type == pygame.QUIT for event in pygame.event.get()):
+            break
+
+        if colors is None:
+            colors = [HIGHLIGHTED_PARTICLES.get(particle_id) for particle_id in particle_ids.tolist()]
+
+        potential = np.sum(potentials)
+        kinetic_energy = np.sum(kinetic_energies)
+
+        logger.append(
+            kinetic_energy=kinetic_energy / particles_number,
+            potential_energy=potential / particles_number,
+            total_energy=(kinetic_energy + potential) / particles_number,
+        )
+        painter.draw_arrays(positions, radii, colors)
+
+        pygame.display.update()
+
+    logger.dispose()
+
+
 if __name__ == "__main__" and "simple" not in sys.argv:
-    filename = '/Users/marka/Documents/projects/molecules-platform/molecules_cpp/data_detailed.csv'
     frames_per_iteration = 30
+    trajectories = [argument for argument in sys.argv[1:] if argument.endswith('.trj')]
+
+    if trajectories:
+        reader = TrajectoryReader(trajectories[0])
+        replay(iterate_trajectory_frames(reader, frames_per_iteration), reader.box[0], reader.particles_count)
+    else:
+        filename = '/Users/marka/Documents/projects/molecules-platform/molecules_cpp/data_detailed.csv'
+        with open(filename, 'r') as file:
+            particles_side_count, density, delta_time, width = tuple(float(c) for c in file.readline().split())
+            particles_number = int(particles_side_count) ** 2
 
-    with open(filename, 'r') as file:
-        data = list([s.strip() for s in file.readlines()])
-        particles_side_count, density, delta_time, width = tuple(float(c) for c in data[0].split())
-        particles_number = int(particles_side_count) ** 2
-
-        frames = []
-        for i in range(0, (len(data) - 1) // particles_number, frames_per_iteration):
-            raw_particles = data[i * particles_number + 1 : (i+1) * particles_number + 1]
-            particles = []
-            for raw_particle in raw_particles:
-                frame_id, particle_id, cx, cy, p, kin = tuple(float(c) for c in raw_particle.split())
-                particle = Particle(Vector2D(cx, cy), 0.5, None)
-                particle.potential = p
-                particle.kinetic_energy = kin
-
-                if particle_id == 100:
-                    particle.color = (255, 55, 55)
-                elif particle_id == 437:
-                    particle.color = (55, 255, 55)
-                elif particle_id == 321:
-                    particle.color = (55, 55, 255)
-                particles.append(particle)
-
-            frames.append(particles)
-
-        screen_width = 800
-        screen = pygame.display.set_mode((screen_width, screen_width))
-
-        scale = screen_width / width
-        painter = PygamePainter(screen, scale)
-        logger = PlotLogger()
-
-        clock = pygame.time.Clock()
-
-        condition = True
-        for particles in frames:
-            if not condition:
-                break
-            clock.tick(120)
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    condition = False
-
-            potential = 0.0
-            kinetic_energy = 0.0
-            for particle in particles:
-                potential += particle.potential
-                kinetic_energy += particle.kinetic_energy
-
-            logger.kinetic_energy.append(kinetic_energy / particles_number)
-            logger.potential_energy.append(potential / particles_number)
-            logger.total_energy.append((kinetic_energy + potential) / particles_number)
-            painter.draw_particles_(particles)
-
-            pygame.display.update()
-
-        logger.dispose()
+            replay(iterate_text_frames(file, particles_number, frames_per_iteration), width, particles_number)
 
 
 if __name__ == '__main__' and 'simple' in sys.argv:
-    logger = PlotLogger()
     filename = '/Users/marka/Documents/projects/molecules-platform/molecules_cpp/data.csv'
-    with open(filename, 'r') as f:
-        data = list([s.strip().split() for s in f.readlines()])
+    data = np.loadtxt(filename, usecols=(0, 1, 2), ndmin=2)
 
-        logger.kinetic_energy = [float(line[0]) for line in data]
-        logger.potential_energy = [float(line[1]) for line in data]
-        logger.total_energy = [float(line[2]) for line in data]
-        logger.dispose()
+    logger = PlotLogger(capacity=len(data))
+    for kinetic_energy, potential_energy, total_energy in data:
+        logger.append(kinetic_energy=kinetic_energy, potential_energy=potential_energy, total_energy=total_energy)
+    logger.dispose()
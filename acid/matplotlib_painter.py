@@ -7,12 +7,16 @@ website: http://jakevdp.github.com
 license: BSD
 Please feel free to use and modify this, but keep the above information. Thanks!
 """
+import argparse
 import numpy as np
-from scipy.spatial.distance import pdist, squareform
+from particle_arrays import ParticleArrays
+from particles_factory import ParticlesCells
+from event_driven import EventDrivenBox
 
-import matplotlib.pyplot as plt
-import scipy.integrate as integrate
-import matplotlib.animation as animation
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
 
 class ParticleBox:
     """Orbits class
@@ -23,6 +27,9 @@ class ParticleBox:
         ...               ]
 
     bounds is the size of the box: [xmin, xmax, ymin, ymax]
+
+    contacts is how touching pairs are found: 'kdtree' (scipy's cKDTree.query_pairs),
+    'grid' (the counting-sorted cell list of particles_factory) or 'auto' (kdtree when scipy is installed)
     """
     def __init__(self,
                  init_state = [[1, 0, 0, -1],
@@ -31,7 +38,8 @@ class ParticleBox:
                  bounds = [-2, 2, -2, 2],
                  size = 0.04,
                  M = 0.05,
-                 G = 9.8):
+                 G = 9.8,
+                 contacts = 'auto'):
         self.init_state = np.asarray(init_state, dtype=float)
         self.M = M * np.ones(self.init_state.shape[0])
         self.size = size
@@ -40,6 +48,67 @@ class ParticleBox:
         self.bounds = bounds
         self.G = G
 
+        if contacts == 'auto':
+            contacts = 'kdtree' if cKDTree is not None else 'grid'
+        if contacts == 'kdtree' and cKDTree is None:
+            raise ImportError('contacts="kdtree" needs scipy')
+        self.contacts = contacts
+        self.collisions_count = 0
+
+        # The grid is a periodic cell list over the box; pairs across the walls are dropped by the distance test
+        self.origin = np.array(bounds[::2], dtype=float)
+        self.extent = np.array([bounds[1] - bounds[0], bounds[3] - bounds[2]], dtype=float)
+        self.cells = ParticlesCells(self.extent[0], self.extent[1], 2 * size)
+        self.arrays = ParticleArrays(self.state.shape[0])
+
+    def contact_pairs(self):
+        """index arrays (i < j) of the pairs closer than one diameter"""
+        positions = self.state[:, :2]
+        if self.contacts == 'kdtree':
+            pairs = cKDTree(positions).query_pairs(2 * self.size, output_type='ndarray')
+            return pairs[:, 0], pairs[:, 1]
+
+        # Particles that drifted through a wall this step are binned into the edge cells
+        self.arrays.positions = np.clip(positions - self.origin, 0, np.nextafter(self.extent, 0))
+        self.cells.update_cells(self.arrays)
+        ind1, ind2 = self.cells.cell_pair_indices()
+        r_rel = positions[ind1] - positions[ind2]
+        touching = np.einsum('ij,ij->i', r_rel, r_rel) < (2 * self.size) ** 2
+        return ind1[touching], ind2[touching]
+
+    def resolve_collisions(self, ind1, ind2, max_rounds=16):
+        """elastic collisions of the approaching pairs among ind1, ind2, in rounds of disjoint pairs"""
+        for _ in range(max_rounds):
+            # relative location & velocity vectors
+            r_rel = self.state[ind1, :2] - self.state[ind2, :2]
+            v_rel = self.state[ind1, 2:] - self.state[ind2, 2:]
+            vr_rel = np.einsum('ij,ij->i', v_rel, r_rel)
+
+            # only approaching pairs collide, so overlapping spheres separate instead of sticking
+            approaching = vr_rel < 0
+            if not approaching.any():
+                break
+            ind1, ind2, r_rel, vr_rel = ind1[approaching], ind2[approaching], r_rel[approaching], vr_rel[approaching]
+
+            # a round takes each particle's earliest pair, so no particle is in two collisions at once and
+            # every collision conserves energy exactly; the rest is checked again with the new velocities
+            _, first = np.unique(np.stack([ind1, ind2], axis=1).ravel(), return_index=True)
+            is_first = np.zeros(2 * len(ind1), dtype=bool)
+            is_first[first] = True
+            chosen = is_first[0::2] & is_first[1::2]
+
+            i1, i2 = ind1[chosen], ind2[chosen]
+            m1, m2 = self.M[i1, np.newaxis], self.M[i2, np.newaxis]
+            r = r_rel[chosen]
+
+            # the component of v_rel along r_rel is reversed, shared by the mass ratio
+            impulse = r * (2 * vr_rel[chosen] / np.einsum('ij,ij->i', r, r))[:, np.newaxis] / (m1 + m2)
+            self.state[i1, 2:] -= impulse * m2
+            self.state[i2, 2:] += impulse * m1
+            self.collisions_count += len(i1)
+
+            ind1, ind2 = ind1[~chosen], ind2[~chosen]
+
     def step(self, dt):
         """step once by dt seconds"""
         self.time_elapsed += dt
@@ -48,41 +117,10 @@ class ParticleBox:
         self.state[:, :2] += dt * self.state[:, 2:]
 
         # find pairs of particles undergoing a collision
-        D = squareform(pdist(self.state[:, :2]))
-        ind1, ind2 = np.where(D < 2 * self.size)
-        unique = (ind1 < ind2)
-        ind1 = ind1[unique]
-        ind2 = ind2[unique]
+        ind1, ind2 = self.contact_pairs()
 
         # update velocities of colliding pairs
-        for i1, i2 in zip(ind1, ind2):
-            # mass
-            m1 = self.M[i1]
-            m2 = self.M[i2]
-
-            # location vector
-            r1 = self.state[i1, :2]
-            r2 = self.state[i2, :2]
-
-            # velocity vector
-            v1 = self.state[i1, 2:]
-            v2 = self.state[i2, 2:]
-
-            # relative location & velocity vectors
-            r_rel = r1 - r2
-            v_rel = v1 - v2
-
-            # momentum vector of the center of mass
-            v_cm = (m1 * v1 + m2 * v2) / (m1 + m2)
-
-            # collisions of spheres reflect v_rel over r_rel
-            rr_rel = np.dot(r_rel, r_rel)
-            vr_rel = np.dot(v_rel, r_rel)
-            v_rel = 2 * r_rel * vr_rel / rr_rel - v_rel
-
-            # assign new velocities
-            self.state[i1, 2:] = v_cm + v_rel * m2 / (m1 + m2)
-            self.state[i2, 2:] = v_cm - v_rel * m1 / (m1 + m2) 
+        self.resolve_collisions(ind1, ind2)
 
         # check for crossing boundary
         crossed_x1 = (self.state[:, 0] < self.bounds[0] + self.size)
@@ -103,64 +141,96 @@ class ParticleBox:
         self.state[:, 3] -= self.M * self.G * dt
 
 
-
-#------------------------------------------------------------
-# set up initial state
-np.random.seed(0)
-init_state = -0.5 + np.random.random((50, 4))
-init_state[:, :2] *= 3.9
-
-box = ParticleBox(init_state, size=0.04)
-dt = 1. / 30 # 30fps
-
-
-#------------------------------------------------------------
-# set up figure and animation
-fig = plt.figure()
-fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
-ax = fig.add_subplot(111, aspect='equal', autoscale_on=False,
-                     xlim=(-3.2, 3.2), ylim=(-2.4, 2.4))
-
-# particles holds the locations of the particles
-particles, = ax.plot([], [], 'bo', ms=6)
-
-# rect is the box edge
-rect = plt.Rectangle(box.bounds[::2],
-                     box.bounds[1] - box.bounds[0],
-                     box.bounds[3] - box.bounds[2],
-                     ec='none', lw=2, fc='none')
-ax.add_patch(rect)
-
-def init():
-    """initialize animation"""
-    global box, rect
-    particles.set_data([], [])
-    rect.set_edgecolor('none')
-    return particles, rect
-
-def animate(i):
-    """perform animation step"""
-    global box, rect, dt, ax, fig
-    box.step(dt)
-
-    ms = int(fig.dpi * 2 * box.size * fig.get_figwidth()
-             / np.diff(ax.get_xbound())[0])
-    
-    # update pieces of the animation
-    rect.set_edgecolor('k')
-    particles.set_data(box.state[:, 0], box.state[:, 1])
-    particles.set_markersize(ms)
-    return particles, rect
-
-ani = animation.FuncAnimation(fig, animate, frames=600,
-                              interval=10, blit=True, init_func=init)
-
-
-# save the animation as an mp4.  This requires ffmpeg or mencoder to be
-# installed.  The extra_args ensure that the x264 codec is used, so that
-# the video can be embedded in html5.  You may need to adjust this for
-# your system: for more information, see
-# http://matplotlib.sourceforge.net/api/animation_api.html
-#ani.save('particle_box.mp4', fps=30, extra_args=['-vcodec', 'libx264'])
-
-plt.show()
\ No newline at end of file
+def make_state(particles_count, bounds, size, seed=0):
+    """particles on a square lattice in the box with random velocities in [-0.5, 0.5)"""
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(particles_count ** 0.5))
+    xs = np.linspace(bounds[0] + size, bounds[1] - size, side)
+    ys = np.linspace(bounds[2] + size, bounds[3] - size, side)
+    positions = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)[:particles_count]
+    return np.hstack([positions, rng.random((particles_count, 2)) - 0.5])
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Hard spheres with gravity in a box')
+    parser.add_argument('--particles', type=int, default=50)
+    parser.add_argument('--size', type=float, default=0.04)
+    parser.add_argument('--contacts', default='auto', choices=['auto', 'kdtree', 'grid'])
+    parser.add_argument('--event-driven', action='store_true',
+                        help='exact collision times from event_driven.EventDrivenBox, without gravity')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+    arguments = parse_arguments(argv)
+
+    #------------------------------------------------------------
+    # set up initial state
+    if arguments.particles == 50:
+        np.random.seed(0)
+        init_state = -0.5 + np.random.random((50, 4))
+        init_state[:, :2] *= 3.9
+    else:
+        init_state = make_state(arguments.particles, [-2, 2, -2, 2], arguments.size)
+
+    if arguments.event_driven:
+        box = EventDrivenBox(init_state, size=arguments.size)
+    else:
+        box = ParticleBox(init_state, size=arguments.size, contacts=arguments.contacts)
+    dt = 1. / 30 # 30fps
+
+
+    #------------------------------------------------------------
+    # set up figure and animation
+    fig = plt.figure()
+    fig.subplots_adjust(left=0, right=1, bottom=0, top=1)
+    ax = fig.add_subplot(111, aspect='equal', autoscale_on=False,
+                         xlim=(-3.2, 3.2), ylim=(-2.4, 2.4))
+
+    # particles holds the locations of the particles
+    particles, = ax.plot([], [], 'bo', ms=6)
+
+    # rect is the box edge
+    rect = plt.Rectangle(box.bounds[::2],
+                         box.bounds[1] - box.bounds[0],
+                         box.bounds[3] - box.bounds[2],
+                         ec='none', lw=2, fc='none')
+    ax.add_patch(rect)
+
+    def init():
+        """initialize animation"""
+        particles.set_data([], [])
+        rect.set_edgecolor('none')
+        return particles, rect
+
+    def animate(i):
+        """perform animation step"""
+        box.step(dt)
+
+        ms = int(fig.dpi * 2 * box.size * fig.get_figwidth()
+                 / np.diff(ax.get_xbound())[0])
+
+        # update pieces of the animation
+        rect.set_edgecolor('k')
+        particles.set_data(box.state[:, 0], box.state[:, 1])
+        particles.set_markersize(ms)
+        return particles, rect
+
+    ani = animation.FuncAnimation(fig, animate, frames=600,
+                                  interval=10, blit=True, init_func=init)
+
+
+    # save the animation as an mp4.  This requires ffmpeg or mencoder to be
+    # installed.  The extra_args ensure that the x264 codec is used, so that
+    # the video can be embedded in html5.  You may need to adjust this for
+    # your system: for more information, see
+    # http://matplotlib.sourceforge.net/api/animation_api.html
+    #ani.save('particle_box.mp4', fps=30, extra_args=['-vcodec', 'libx264'])
+
+    plt.show()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import importlib.util
+import numpy as np
+
+# Importing numba costs a few hundred milliseconds, so it is only loaded by compile_kernels(), which
+# Calculator calls when a numba backend is selected. Until then the kernels below are plain Python functions.
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
+numba = None
+prange = range
+
+_KERNELS = {}
+
+
+def _kernel(parallel):
+    def register(function):
+        _KERNELS[function.__name__] = parallel
+        return function
+    return register
+
+
+jit = _kernel(parallel=False)
+parallel_jit = _kernel(parallel=True)
+
+
+def compile_kernels():
+    # Swaps every registered kernel for its numba dispatcher; returns whether numba is usable
+    global numba, prange, NUMBA_AVAILABLE
+    if numba is not None or not NUMBA_AVAILABLE:
+        return NUMBA_AVAILABLE
+    try:
+        import numba as numba_module
+    except ImportError:
+        NUMBA_AVAILABLE = False
+        return False
+
+    numba = numba_module
+    prange = numba.prange
+    for name, parallel in _KERNELS.items():
+        globals()[name] = numba.njit(cache=True, parallel=parallel)(globals()[name])
+    return True
+
+
+@jit
+def translate_and_kick(positions, velocities, accelerations, delta_time, box):
+    # x += v dt + a dt^2 / 2, v += a dt / 2, then periodic wrap
+    for i in range(positions.shape[0]):
+        for d in range(positions.shape[1]):
+            position = positions[i, d] + velocities[i, d] * delta_time + accelerations[i, d] * (delta_time ** 2 / 2)
+            velocities[i, d] += accelerations[i, d] * (delta_time / 2)
+            positions[i, d] = position % box[d]
+
+
+@jit
+def kick(velocities, accelerations, delta_time):
+    for i in range(velocities.shape[0]):
+        for d in range(velocities.shape[1]):
+            velocities[i, d] += accelerations[i, d] * (delta_time / 2)
+
+
+@jit
+def _accumulate_pairs(positions, box, index_i, index_j, cut_off_squared, start, end, accelerations, potentials):
+    dimensions = positions.shape[1]
+    radius_i_j = np.empty(dimensions)
+    virial = 0.0
+    inside_count = 0
+    for k in range(start, end):
+        i = index_i[k]
+        j = index_j[k]
+
+        distance_squared = 0.0
+        for d in range(dimensions):
+            delta = positions[j, d] - positions[i, d]
+            if abs(delta) > box[d] / 2:
+                delta -= box[d] * np.sign(delta)
+            radius_i_j[d] = delta
+            distance_squared += delta * delta
+
+        if distance_squared < cut_off_squared:
+            inverted_squared = 1 / distance_squared
+            inverted_6 = inverted_squared ** 3
+            factor = -48 * inverted_squared * inverted_6 * (inverted_6 - 0.5)
+            for d in range(dimensions):
+                accelerations[i, d] += radius_i_j[d] * factor
+                accelerations[j, d] -= radius_i_j[d] * factor
+
+            potential_i_j = 4 * inverted_6 * (inverted_6 - 1)
+            potentials[i] += potential_i_j
+            potentials[j] += potential_i_j
+            virial += 48 * inverted_6 * (inverted_6 - 0.5)
+            inside_count += 1
+
+    return virial, inside_count
+
+
+@jit
+def _pair_forces(positions, box, index_i, index_j, cut_off_squared, accelerations, potentials):
+    return _accumulate_pairs(positions, box, index_i, index_j, cut_off_squared, 0, len(index_i), accelerations, potentials)
+
+
+@parallel_jit
+def _pair_forces_parallel(positions, box, index_i, index_j, cut_off_squared, accelerations, potentials, chunks_count):
+    # Every chunk of pairs scatters into its own partial arrays, the partials are summed afterwards
+    particles_count, dimensions = positions.shape
+    partial_accelerations = np.zeros((chunks_count, particles_count, dimensions))
+    partial_potentials = np.zeros((chunks_count, particles_count))
+    partial_virials = np.zeros(chunks_count)
+    partial_inside_counts = np.zeros(chunks_count, dtype=np.int64)
+    chunk_size = (len(index_i) + chunks_count - 1) // chunks_count
+
+    for chunk in prange(chunks_count):
+        start = chunk * chunk_size
+        end = min(start + chunk_size, len(index_i))
+        partial_virials[chunk], partial_inside_counts[chunk] = _accumulate_pairs(
+            positions, box, index_i, index_j, cut_off_squared, start, end,
+            partial_accelerations[chunk], partial_potentials[chunk]
+        )
+
+    for chunk in range(chunks_count):
+        accelerations += partial_accelerations[chunk]
+        potentials += partial_potentials[chunk]
+    return partial_virials.sum(), partial_inside_counts.sum()
+
+
+def lennard_jones_forces(positions, box, index_i, index_j, cut_off_distance, parallel=False):
+    accelerations = np.zeros(positions.shape)
+    potentials = np.zeros(positions.shape[0])
+    box = np.asarray(box, dtype=float)
+
+    if parallel:
+        virial, inside_count = _pair_forces_parallel(positions, box, index_i, index_j, cut_off_distance ** 2,
+                                                     accelerations, potentials, numba.get_num_threads())
+    else:
+        virial, inside_count = _pair_forces(positions, box, index_i, index_j, cut_off_distance ** 2,
+                                            accelerations, potentials)
+
+    return accelerations, potentials, virial, int(inside_count)
@@ -0,0 +1,60 @@
+import numpy as np
+from particles_factory import ParticlesCells
+
+
+class Observables:
+    FIELDS = ('kinetic_energy', 'potential_energy', 'total_energy', 'temperature', 'momentum', 'pressure')
+
+    def __init__(self, capacity=100000, stride=1, shape=()):
+        # Ring buffers: once full, the oldest samples are overwritten. Each sample has the given shape,
+        # e.g. (replicas_count,) for an ensemble.Ensemble
+        self.capacity = capacity
+        self.stride = stride
+        self.buffers = {field: np.zeros((capacity, *shape)) for field in self.FIELDS}
+        self.samples_count = 0
+        self.calls_count = 0
+
+    def __len__(self):
+        return min(self.samples_count, self.capacity)
+
+    def log_particles(self, particles: ParticlesCells):
+        self.calls_count += 1
+        if self.calls_count % self.stride == 0:
+            self.append(**self.measure(particles))
+
+    def measure(self, particles: ParticlesCells):
+        # Per-particle values; the virial is left behind by the force pass
+        state = particles.arrays
+        number, dimensions = state.positions.shape
+        volume = np.prod(particles.box)
+
+        momentum = state.masses @ state.velocities
+        kinetic_energy = 0.5 * np.einsum('i,ij,ij->', state.masses, state.velocities, state.velocities)
+        potential_energy = 0.5 * np.sum(state.potentials)
+
+        # Center of mass motion is removed at start, so it carries no thermal degrees of freedom
+        temperature = 2 * kinetic_energy / (dimensions * max(number - 1, 1))
+        pressure = (number * temperature + state.virial / dimensions) / volume
+
+        return {
+            'kinetic_energy': kinetic_energy / number,
+            'potential_energy': potential_energy / number,
+            'total_energy': (kinetic_energy + potential_energy) / number,
+            'temperature': temperature,
+            'momentum': np.linalg.norm(momentum),
+            'pressure': pressure,
+        }
+
+    def append(self, **values):
+        index = self.samples_count % self.capacity
+        for field, value in values.items():
+            self.buffers[field][index] = value
+        self.samples_count += 1
+
+    def values(self, field):
+        # Samples in chronological order
+        buffer = self.buffers[field]
+        if self.samples_count <= self.capacity:
+            return buffer[:self.samples_count]
+        index = self.samples_count % self.capacity
+        return np.concatenate((buffer[index:], buffer[:index]))
@@ -0,0 +1,107 @@
+from queue import Queue, Full
+from threading import Thread
+from particles_factory import ParticlesCells
+
+
+class Snapshot:
+    # Read-only copy of the state with the ParticlesCells surface observers read from
+    def __init__(self, particles: ParticlesCells):
+        self.width = particles.width
+        self.height = particles.height
+        self.depth = particles.depth
+        self.box = particles.box
+        self.iteration_index = particles.iteration_index
+        self.arrays = particles.arrays.frozen_copy()
+
+
+_CLOSE = object()
+
+
+class Subscription:
+    def __init__(self, consumer, stride, policy, queue_size):
+        self.consumer = consumer
+        self.stride = stride
+        self.policy = policy
+        self.queue = Queue(maxsize=queue_size)
+
+        self.offered_count = 0
+        self.dropped_count = 0
+        self.decimation = 1
+        self.error = None
+
+        self.thread = Thread(target=self.drain, daemon=True)
+        self.thread.start()
+
+    def offer(self, snapshot: Snapshot):
+        if self.policy == 'block':
+            self.queue.put(snapshot)
+            return
+
+        self.offered_count += 1
+        if self.offered_count % self.decimation:
+            self.dropped_count += 1
+            return
+
+        try:
+            self.queue.put_nowait(snapshot)
+        except Full:
+            self.dropped_count += 1
+            if self.policy == 'decimate':
+                self.decimation *= 2
+            return
+
+        # The consumer caught up: take denser samples again
+        if self.policy == 'decimate' and self.decimation > 1 and self.queue.qsize() <= self.queue.maxsize // 4:
+            self.decimation //= 2
+
+    def drain(self):
+        while True:
+            snapshot = self.queue.get()
+            if snapshot is _CLOSE:
+                return
+            if self.error is not None:
+                continue
+            try:
+                self.consumer.log_particles(snapshot)
+            except Exception as error:
+                self.error = error
+
+    def close(self):
+        self.queue.put(_CLOSE)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+# Calculator publishes snapshots, every subscriber drains its own bounded queue on a worker thread.
+# Policies for a full queue: 'block' waits, 'drop' skips the snapshot, 'decimate' skips it and
+# only offers every 2nd, 4th, ... snapshot to that subscriber until its queue drains again.
+class ObserverBus:
+    POLICIES = ('block', 'drop', 'decimate')
+
+    def __init__(self, policy='block', queue_size=8):
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown backpressure policy {policy}')
+
+        self.policy = policy
+        self.queue_size = queue_size
+        self.subscriptions = []
+
+    def subscribe(self, consumer, stride=1):
+        subscription = Subscription(consumer, stride, self.policy, self.queue_size)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def publish(self, particles: ParticlesCells):
+        snapshot = None
+        for subscription in self.subscriptions:
+            if particles.iteration_index % subscription.stride:
+                continue
+            if snapshot is None:
+                snapshot = Snapshot(particles)
+            subscription.offer(snapshot)
+
+    def close(self):
+        for subscription in self.subscriptions:
+            subscription.close()
+        self.subscriptions = []
@@ -0,0 +1,147 @@
+import argparse
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+from time import perf_counter
+from forces import pair_forces
+from potentials import LennardJones
+from particles_factory import ParticlesCells, cell_pairs_to_particle_pairs
+
+
+# Worker side: views on the shared blocks, attached once per process by the pool initializer
+_shared_arrays = {}
+_potential = None
+
+
+def _attach_shared_arrays(specs, potential):
+    global _potential
+    _potential = potential
+    for key, (name, shape) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        _shared_arrays[key] = (block, np.ndarray(shape, dtype=_DTYPES[key], buffer=block.buf))
+
+
+def _compute_domain(task):
+    domain_index, cell_a, cell_b, box, cut_off_distance = task
+    positions = _shared_arrays['positions'][1]
+    cell_start = _shared_arrays['cell_start'][1]
+    permutation = _shared_arrays['permutation'][1]
+
+    # Adjacent cells outside the domain (including the periodic wrap) are the halo; they are only read
+    index_i, index_j = cell_pairs_to_particle_pairs(cell_start, permutation, cell_a, cell_b)
+    accelerations, potentials, virial, inside_count = pair_forces(positions, box, index_i, index_j, cut_off_distance, _potential)
+
+    # Every domain owns its own partial slot, so there are no concurrent writes to reduce
+    _shared_arrays['accelerations'][1][domain_index] = accelerations
+    _shared_arrays['potentials'][1][domain_index] = potentials
+    return len(index_i), virial, inside_count
+
+
+_DTYPES = {
+    'positions': np.float64,
+    'cell_start': np.int64,
+    'permutation': np.int64,
+    'accelerations': np.float64,
+    'potentials': np.float64,
+}
+
+
+class DomainDecomposition:
+    def __init__(self, particles: ParticlesCells, workers_count: int, domains_count: int = None, potential=None):
+        self.workers_count = workers_count
+        self.domains_count = domains_count or workers_count
+
+        particles_count, dimensions = particles.arrays.positions.shape
+        shapes = {
+            'positions': (particles_count, dimensions),
+            'cell_start': (particles.cells_count + 1,),
+            'permutation': (particles_count,),
+            'accelerations': (self.domains_count, particles_count, dimensions),
+            'potentials': (self.domains_count, particles_count),
+        }
+
+        self.blocks = {}
+        self.arrays = {}
+        for key, shape in shapes.items():
+            size = max(int(np.prod(shape)) * np.dtype(_DTYPES[key]).itemsize, 1)
+            block = shared_memory.SharedMemory(create=True, size=size)
+            self.blocks[key] = block
+            self.arrays[key] = np.ndarray(shape, dtype=_DTYPES[key], buffer=block.buf)
+
+        specs = {key: (block.name, shapes[key]) for key, block in self.blocks.items()}
+        self.pool = multiprocessing.Pool(workers_count, initializer=_attach_shared_arrays, initargs=(specs, potential or LennardJones()))
+
+    def split_cell_pairs(self, particles: ParticlesCells):
+        # Contiguous ranges of flat cell ids are strips of rows; boundaries balance the expected pair work
+        cell_a, cell_b = particles.neighbor_cells
+        counts = np.diff(particles.cell_start)
+        work = np.cumsum(counts[cell_a] * counts[cell_b])
+        bounds = np.searchsorted(work, np.linspace(0, work[-1], self.domains_count + 1)[1:-1])
+        return zip(np.split(cell_a, bounds), np.split(cell_b, bounds))
+
+    def compute(self, particles: ParticlesCells, box, cut_off_distance):
+        self.arrays['positions'][:] = particles.arrays.positions
+        self.arrays['cell_start'][:] = particles.cell_start
+        self.arrays['permutation'][:] = particles.permutation
+
+        box = np.asarray(box, dtype=float)
+        tasks = [
+            (domain_index, cell_a, cell_b, box, cut_off_distance)
+            for domain_index, (cell_a, cell_b) in enumerate(self.split_cell_pairs(particles))
+        ]
+        pairs_counts, virials, inside_counts = zip(*self.pool.map(_compute_domain, tasks))
+
+        accelerations = self.arrays['accelerations'][:len(tasks)].sum(axis=0)
+        potentials = self.arrays['potentials'][:len(tasks)].sum(axis=0)
+        return accelerations, potentials, sum(virials), sum(inside_counts), sum(pairs_counts)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.arrays.clear()
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+
+def measure_scaling(particles_count, density, cut_off_distance, max_workers, steps=20):
+    # Same initial state for every worker count; efficiency = t(1) / (n * t(n))
+    from random import seed
+    from calculator import Calculator, get_width_height
+    from particles_factory import make_particles
+
+    width, height = get_width_height(particles_count, density)
+    results = []
+    for workers_count in range(1, max_workers + 1):
+        seed(0)
+        particles = make_particles(width, height, particles_count, cut_off_distance, velocity_mul=4)
+        calculator = Calculator(width, height, particles, cut_off_distance=cut_off_distance, workers=workers_count)
+        calculator.iteration_2(particles, log_time=False)
+
+        t1 = perf_counter()
+        for _ in range(steps):
+            calculator.iteration_2(particles, log_time=False)
+        seconds = (perf_counter() - t1) / steps
+        calculator.close()
+
+        results.append({'workers': workers_count, 'seconds_per_step': seconds})
+
+    for result in results:
+        result['efficiency'] = results[0]['seconds_per_step'] / (result['workers'] * result['seconds_per_step'])
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Force phase scaling from 1 to N worker processes')
+    parser.add_argument('--particles', type=int, default=20000)
+    parser.add_argument('--density', type=float, default=0.81)
+    parser.add_argument('--cut-off-distance', type=float, default=2.5)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--steps', type=int, default=20)
+    arguments = parser.parse_args()
+
+    for result in measure_scaling(arguments.particles, arguments.density, arguments.cut_off_distance,
+                                  arguments.workers, arguments.steps):
+        print(f"{result['workers']} workers: {result['seconds_per_step'] * 1000:.2f} ms/step, "
+              f"efficiency {result['efficiency'] * 100:.0f}%")
@@ -1,24 +1,95 @@
 import numpy as np
-from vector import Vector2D
+from vector import Vector2D, vector_of
+from particle_arrays import ParticleArrays
 
+# Thin view over one row of ParticleArrays. A standalone particle owns a one-row store.
 class Particle:
     last_particle_id = 0
 
     def __init__(self, center: Vector2D, radius: float, velocity: Vector2D = None, color=None):
         Particle.last_particle_id += 1
+        self._arrays = ParticleArrays(1, len(center.coordinates))
+        self._index = 0
         self.id = Particle.last_particle_id
 
         self.radius = radius
         self.center = center
 
         if (velocity is None):
-            velocity = Vector2D()
+            velocity = type(center)()
         self.velocity = velocity
         self.color = color
 
-        self.acceleration = Vector2D()
-        self.potential = 0.0
-        self.mass = 1
+    @classmethod
+    def view(cls, arrays: ParticleArrays, index: int):
+        particle = cls.__new__(cls)
+        particle._arrays = arrays
+        particle._index = index
+        return particle
+
+    @property
+    def id(self):
+        return int(self._arrays.ids[self._index])
+
+    @id.setter
+    def id(self, id):
+        self._arrays.ids[self._index] = id
+
+    @property
+    def center(self):
+        return vector_of(self._arrays.positions[self._index])
+
+    @center.setter
+    def center(self, center: Vector2D):
+        self._arrays.positions[self._index] = center.coordinates
+
+    @property
+    def velocity(self):
+        return vector_of(self._arrays.velocities[self._index])
+
+    @velocity.setter
+    def velocity(self, velocity: Vector2D):
+        self._arrays.velocities[self._index] = velocity.coordinates
+
+    @property
+    def acceleration(self):
+        return vector_of(self._arrays.accelerations[self._index])
+
+    @acceleration.setter
+    def acceleration(self, acceleration: Vector2D):
+        self._arrays.accelerations[self._index] = acceleration.coordinates
+
+    @property
+    def potential(self):
+        return self._arrays.potentials[self._index]
+
+    @potential.setter
+    def potential(self, potential):
+        self._arrays.potentials[self._index] = potential
+
+    @property
+    def mass(self):
+        return self._arrays.masses[self._index]
+
+    @mass.setter
+    def mass(self, mass):
+        self._arrays.masses[self._index] = mass
+
+    @property
+    def radius(self):
+        return self._arrays.radii[self._index]
+
+    @radius.setter
+    def radius(self, radius):
+        self._arrays.radii[self._index] = radius
+
+    @property
+    def color(self):
+        return self._arrays.colors[self._index]
+
+    @color.setter
+    def color(self, color):
+        self._arrays.colors[self._index] = color
 
     def translate(self, delta_radius: Vector2D):
         self.center = self.center + delta_radius
@@ -53,4 +124,4 @@ class Particle:
             # float(args[5]),
             # float(args[6]),
             # float(args[7]),
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class ParticleArrays:
+    def __init__(self, count: int = 0, dimensions: int = 2):
+        self.positions = np.zeros((count, dimensions))
+        self.velocities = np.zeros((count, dimensions))
+        self.accelerations = np.zeros((count, dimensions))
+        self.potentials = np.zeros(count)
+        self.masses = np.ones(count)
+        self.radii = np.full(count, 0.5)
+        self.ids = np.arange(1, count + 1)
+        self.colors = [None] * count
+
+        # By-product of the last force pass: sum over pairs of r_ij . f_ij
+        self.virial = 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dimensions(self):
+        return self.positions.shape[1]
+
+    def frozen_copy(self):
+        arrays = ParticleArrays.__new__(ParticleArrays)
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                value = value.copy()
+                value.setflags(write=False)
+            elif isinstance(value, list):
+                value = tuple(value)
+            setattr(arrays, name, value)
+        return arrays
+
+    @classmethod
+    def from_particles(cls, particles):
+        particles = list(particles)
+        arrays = cls(len(particles), len(particles[0].center.coordinates) if particles else 2)
+
+        for index, particle in enumerate(particles):
+            arrays.positions[index] = particle.center.coordinates
+            arrays.velocities[index] = particle.velocity.coordinates
+            arrays.accelerations[index] = particle.acceleration.coordinates
+            arrays.potentials[index] = particle.potential
+            arrays.masses[index] = particle.mass
+            arrays.radii[index] = particle.radius
+            arrays.ids[index] = particle.id
+            arrays.colors[index] = particle.color
+
+        return arrays
@@ -1,83 +1,400 @@
 from particle import Particle
-from vector import Vector2D
+from particle_arrays import ParticleArrays
 from random import random
 import numpy as np
+from forces import minimum_image
+import itertools
+
+def _concatenated_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    # [starts[0], ..., starts[0] + lengths[0]) + [starts[1], ...) + ... without a Python loop
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+def cell_pairs_to_particle_pairs(cell_start, permutation, cell_a, cell_b):
+    counts = np.diff(cell_start)
+
+    left = _concatenated_ranges(cell_start[cell_a], counts[cell_a])
+    owner = np.repeat(np.arange(len(cell_a)), counts[cell_a])
+
+    # Inside a cell pair only with the particles sorted after, otherwise with the whole adjacent cell
+    same_cell = (cell_a == cell_b)[owner]
+    right_start = np.where(same_cell, left + 1, cell_start[cell_b[owner]])
+    right_count = cell_start[cell_b[owner] + 1] - right_start
+
+    right = _concatenated_ranges(right_start, right_count)
+    left = np.repeat(left, right_count)
+
+    index_i = permutation[left]
+    index_j = permutation[right]
+    return np.minimum(index_i, index_j), np.maximum(index_i, index_j)
+
+
+def half_shell(dimensions, reach=1):
+    # Half of the (2 reach + 1)^d stencil: the cell itself and every offset whose last nonzero component is positive,
+    # so every unordered pair of neighbour cells is reached exactly once (5 offsets in 2D, 14 in 3D for reach 1)
+    offsets = [offset for offset in itertools.product(range(-reach, reach + 1), repeat=dimensions)
+               if not any(offset) or [component for component in offset if component][-1] > 0]
+    return np.array(offsets)
+
 
 class ParticlesCells:
-    def __init__(self, width, height, cut_off_distance):
+    def __init__(self, width, height, cut_off_distance, skin=None, depth=None, cells_per_cut_off=1):
         self.width = width
         self.height = height
-        self.rows_count = max(int(height / cut_off_distance), 1)
-        self.cols_count = max(int(width / cut_off_distance), 1)
+        # A depth makes the box three dimensional
+        self.depth = depth
         self.cut_off_distance = cut_off_distance
-        self.cells = []
+        # Verlet list mode: pairs within cut_off_distance + skin are reused until someone moved skin / 2
+        self.skin = skin
+        # Cells of list_distance / k with a stencil reaching k cells: fewer candidate pairs outside the cut-off
+        # for more cell pairs, worth it in 3D where a 27 cell shell holds ~6 times the cut-off sphere
+        self.cells_per_cut_off = cells_per_cut_off
+        cell_length = self.list_distance / cells_per_cut_off
+        self.rows_count = max(int(height / cell_length), 1)
+        self.cols_count = max(int(width / cell_length), 1)
+        self.layers_count = max(int(depth / cell_length), 1) if depth is not None else 1
+        self.arrays = ParticleArrays(dimensions=self.dimensions)
+        self.iteration_index = 0
+
+        self.verlet_pairs = None
+        self.reference_positions = None
+        self.reference_box = None
+        self.updates_count = 0
+        self.rebuilds_count = 0
+
+        self.cell_ids = np.zeros(0, dtype=int)
+        self.permutation = np.zeros(0, dtype=int)
+        self.cell_start = np.zeros(self.cells_count + 1, dtype=int)
+        self.neighbor_cells = self.make_neighbor_cells()
+
+    def resize(self, width, height, depth=None):
+        # New box for particles whose positions were scaled with it, e.g. by a barostat; the cell grid follows.
+        # A Verlet list stays valid while the grid does: the references are scaled alike and needs_rebuild accounts
+        # for the shrinking. A new grid empties the cells, so the next update_cells rebuilds them
+        scale = np.array([width, height, depth][:self.dimensions], dtype=float) / self.box
+        if self.reference_positions is not None:
+            self.reference_positions = self.reference_positions * scale
+        self.width = width
+        self.height = height
+        self.depth = depth
+        cell_length = self.list_distance / self.cells_per_cut_off
+        cells_per_axis = self.cells_per_axis
+        self.rows_count = max(int(height / cell_length), 1)
+        self.cols_count = max(int(width / cell_length), 1)
+        self.layers_count = max(int(depth / cell_length), 1) if depth is not None else 1
+        # The stencil pruning depends on the cell size, so the neighbour cells change with the grid or the stencil
+        offsets = self.stencil_offsets()
+        if not np.array_equal(cells_per_axis, self.cells_per_axis):
+            self.cell_start = np.zeros(self.cells_count + 1, dtype=int)
+            self.neighbor_cells = self.make_neighbor_cells(offsets)
+            self.reference_positions = None
+        elif not np.array_equal(offsets, self.offsets):
+            self.neighbor_cells = self.make_neighbor_cells(offsets)
+
+    @property
+    def dimensions(self):
+        return 2 if self.depth is None else 3
+
+    @property
+    def box(self):
+        return np.array([self.width, self.height, self.depth][:self.dimensions], dtype=float)
+
+    @property
+    def cells_per_axis(self):
+        # Along x, y (and z); a flat cell id is col + cols_count * (row + rows_count * layer)
+        return np.array([self.cols_count, self.rows_count, self.layers_count][:self.dimensions])
+
+    @property
+    def cell_strides(self):
+        return np.concatenate(([1], np.cumprod(self.cells_per_axis[:-1])))
+
+    @property
+    def list_distance(self):
+        return self.cut_off_distance + (self.skin or 0.0)
+
+    @property
+    def rebuild_rate(self):
+        return self.rebuilds_count / self.updates_count if self.updates_count else 0.0
+
+    @property
+    def cells_count(self):
+        return self.rows_count * self.cols_count * self.layers_count
+
+    def stencil_offsets(self):
+        # Offsets whose cells are farther apart than list_distance at their closest are left out
+        offsets = half_shell(self.dimensions, self.cells_per_cut_off)
+        gaps = np.maximum(np.abs(offsets) - 1, 0) * (self.box / self.cells_per_axis)
+        return offsets[np.einsum('ij,ij->i', gaps, gaps) < self.list_distance ** 2]
+
+    def make_neighbor_cells(self, offsets=None):
+        cells_per_axis, cell_strides = self.cells_per_axis, self.cell_strides
+        cells = np.arange(self.cells_count)
+        coordinates = (cells[:, np.newaxis] // cell_strides) % cells_per_axis
+        if offsets is None:
+            offsets = self.stencil_offsets()
+        self.offsets = offsets
+
+        cell_a, cell_b = [], []
+        for offset in offsets:
+            adjacent = ((coordinates + offset) % cells_per_axis) @ cell_strides
+            cell_a.append(np.minimum(cells, adjacent))
+            cell_b.append(np.maximum(cells, adjacent))
+
+        # With fewer than 3 cells per side the wrap maps several offsets onto one cell; unique on flat keys
+        # sorts the pairs as rows would, at a fraction of the cost
+        keys = np.sort(np.concatenate(cell_a) * self.cells_count + np.concatenate(cell_b))
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        return keys // self.cells_count, keys % self.cells_count
 
     def update_cells(self, particles=None):
-        if particles is None:
-            particles = self.iterate_throw_particles()
+        if particles is not None:
+            if not isinstance(particles, ParticleArrays):
+                particles = ParticleArrays.from_particles(particles)
+            self.arrays = particles
+            self.reference_positions = None
+
+        if self.skin is not None:
+            self.updates_count += 1
+            if not self.needs_rebuild():
+                return
+            self.rebuilds_count += 1
+
+        positions = self.arrays.positions
+        cells_per_axis = self.cells_per_axis
+        cell_indices = np.minimum((positions * (cells_per_axis / self.box)).astype(int), cells_per_axis - 1)
+        self.cell_ids = cell_indices @ self.cell_strides
+
+        # Counting sort: particles of cell c are permutation[cell_start[c]:cell_start[c + 1]]
+        counts = np.bincount(self.cell_ids, minlength=self.cells_count)
+        self.cell_start = np.concatenate(([0], np.cumsum(counts)))
+        self.permutation = np.argsort(self.cell_ids, kind='stable')
 
-        cells = [[[] for j in range(self.cols_count)] for i in range(self.rows_count)]
-        for particle in particles:
-            row_index = int(particle.center.y / self.height * self.rows_count)
-            col_index = int(particle.center.x / self.width * self.cols_count)
-            cells[row_index][col_index].append(particle)
+        if self.skin is not None:
+            self.verlet_pairs = self.filter_pairs(*self.cell_pair_indices(), self.list_distance)
+            self.reference_positions = positions.copy()
+            self.reference_box = self.box
 
-        self.cells = cells
+    def needs_rebuild(self):
+        if self.reference_positions is None or len(self.reference_positions) != len(self.arrays):
+            return True
+
+        # Pairs left out at list_distance are at least scale * list_distance apart once the box shrank by scale
+        scale = 1.0 if self.reference_box is None else min(np.min(self.box / self.reference_box), 1.0)
+        allowed = self.skin / 2 if scale == 1.0 else (scale * self.list_distance - self.cut_off_distance) / 2
+        if allowed <= 0:
+            return True
+        displacement = minimum_image(self.arrays.positions - self.reference_positions, self.box)
+        return np.max(np.einsum('ij,ij->i', displacement, displacement), initial=0.0) > allowed ** 2
+
+    def filter_pairs(self, index_i, index_j, distance):
+        radius_i_j = minimum_image(self.arrays.positions[index_j] - self.arrays.positions[index_i], self.box)
+        inside = np.einsum('ij,ij->i', radius_i_j, radius_i_j) < distance ** 2
+        return index_i[inside], index_j[inside]
+
+    def pair_indices(self):
+        if self.skin is not None:
+            return self.verlet_pairs
+        return self.cell_pair_indices()
+
+    def cell_pair_indices(self):
+        return cell_pairs_to_particle_pairs(self.cell_start, self.permutation, *self.neighbor_cells)
+
+    def iterate_throw_index_pairs(self):
+        yield from zip(*(indices.tolist() for indices in self.pair_indices()))
 
     def iterate_throw_particle_pairs(self):
-        for i in range(self.rows_count):
-            for j in range(self.cols_count):
-                for particle1 in self.cells[i][j]:
-                    for cell_di in (-1, 0, 1):
-                        for cell_dj in (-1, 0, 1):
-                            adjacent_cell_i = (i + cell_di) % self.rows_count
-                            adjacent_cell_j = (j + cell_dj) % self.cols_count
-                            if adjacent_cell_i < i or (adjacent_cell_i == i and adjacent_cell_j < j):
-                                continue
-
-                            for particle2 in self.cells[adjacent_cell_i][adjacent_cell_j]:
-                                if particle1.id != particle2.id:
-                                    yield particle1, particle2
+        for index1, index2 in self.iterate_throw_index_pairs():
+            yield Particle.view(self.arrays, index1), Particle.view(self.arrays, index2)
 
     def iterate_throw_particles(self):
-        for i in range(self.rows_count):
-            for j in range(self.cols_count):
-                cell = self.cells[i][j]
-                for particle in cell:
-                    yield particle
-
-
-def make_particles(width, height, particles_count, cut_off_distance, velocity_mul=0):
-    cols_count = int((particles_count * width / height)**0.5)
-    rows_count = int(particles_count // cols_count)
-
-    delta_w = width / cols_count
-    delta_h = height / rows_count
-
-    particles = []
-    for i in range(rows_count):
-        for j in range(cols_count):
-            particle = Particle(
-                center=Vector2D(
-                    delta_w * j + 0.5 * delta_w,
-                    delta_h * i + 0.5 * delta_h
-                ),
-                radius=0.5,
-                velocity=Vector2D(random() - 0.5, random() - 0.5) * velocity_mul
-            )
-            particles.append(particle)
-
-    cells = ParticlesCells(width, height, cut_off_distance)
-    cells.update_cells(particles)
+        for index in range(len(self.arrays)):
+            yield Particle.view(self.arrays, index)
+
+
+def lattice_positions(box, particles_count, lattice='square'):
+    # particles_count sites of a square (cubic) or, in 2D, hexagonal lattice filling the box. The lattice
+    # is the smallest one with enough sites; vacancies are spread evenly, so a full lattice takes every site
+    box = np.asarray(box, dtype=float)
+    dimensions = len(box)
+    volume = np.prod(box)
+
+    if lattice == 'square':
+        # Sites per axis follow the box aspect ratio; the last axis takes what is left
+        counts = [max(int(np.ceil((particles_count * length ** dimensions / volume) ** (1 / dimensions) - 1e-9)), 1)
+                  for length in box[:-1]]
+        counts.append(max(int(np.ceil(particles_count / np.prod(counts))), 1))
+    elif lattice == 'hex':
+        if dimensions != 2:
+            raise ValueError('The hexagonal lattice is two dimensional')
+        # Rows of spacing a sqrt(3) / 2, every other one shifted by a / 2; an even number of rows keeps it periodic
+        spacing = np.sqrt(2 * volume / (np.sqrt(3) * particles_count))
+        rows_count = max(2 * int(round(box[1] / (spacing * np.sqrt(3)))), 2)
+        counts = [max(int(np.ceil(particles_count / rows_count)), 1), rows_count]
+    else:
+        raise ValueError(f'Unknown lattice {lattice}')
+
+    sites_count = int(np.prod(counts))
+    # Fastest along the first axis, so in 2D rows of constant y are filled one after another
+    site = np.arange(particles_count) * sites_count // particles_count
+    indices = np.empty((particles_count, dimensions), dtype=int)
+    for axis, count in enumerate(counts):
+        indices[:, axis] = site % count
+        site = site // count
+
+    deltas = box / counts
+    positions = deltas * indices + 0.5 * deltas
+    if lattice == 'hex':
+        # Even rows a quarter spacing to the left, odd rows a quarter to the right
+        positions[:, 0] += (indices[:, 1] % 2 - 0.5) * 0.5 * deltas[0]
+    return positions
+
+
+def random_sequential_addition(box, particles_count, min_distance, rng: np.random.Generator, max_candidates=None):
+    # Uniform random positions, each at least min_distance (minimum image) from all others. The box is cut into
+    # cells of diagonal min_distance, which hold one particle at most, and candidates are drawn uniformly inside
+    # the empty cells only: the same distribution as drawing over the whole box, without the hopeless draws.
+    # Candidates come in batches, within a batch random priorities decide which of two overlapping ones stays
+    box = np.asarray(box, dtype=float)
+    dimensions = len(box)
+    cells_per_axis = np.maximum((box * np.sqrt(dimensions) / min_distance).astype(int), 1)
+    cell_strides = np.concatenate(([1], np.cumprod(cells_per_axis[:-1])))
+    cell_length = box / cells_per_axis
+
+    # Other cells that can hold a particle closer than min_distance
+    reach = int(np.ceil(np.sqrt(dimensions)))
+    offsets = np.array([offset for offset in itertools.product(range(-reach, reach + 1), repeat=dimensions) if any(offset)])
+    gaps = np.maximum(np.abs(offsets) - 1, 0) * cell_length
+    offsets = offsets[np.einsum('ij,ij->i', gaps, gaps) < min_distance ** 2]
+
+    def neighbor_terms(cells):
+        # terms[axis][shift + reach] is the wrapped coordinate along axis, shifted, times its stride: the flat id
+        # of a neighbour is a sum of one term per axis. Integer matrix products would be slow
+        return [[(cells[:, axis] + shift) % cells_per_axis[axis] * cell_strides[axis] for shift in range(-reach, reach + 1)]
+                for axis in range(dimensions)]
+
+    def clashes(candidates, terms, grid_positions, occupied=None, grid_priorities=None, priorities=None):
+        # Per candidate, whether the particle of a surrounding cell (one with a smaller priority, if given)
+        # is closer than min_distance
+        clash = np.zeros(len(candidates), dtype=bool)
+        for offset in offsets:
+            neighbors = terms[0][offset[0] + reach]
+            for axis in range(1, dimensions):
+                neighbors = neighbors + terms[axis][offset[axis] + reach]
+            if priorities is None:
+                present = np.flatnonzero(occupied[neighbors])
+            else:
+                present = np.flatnonzero(grid_priorities[neighbors] < priorities)
+            radius = minimum_image(grid_positions[neighbors[present]] - candidates[present], box)
+            clash[present[np.einsum('ij,ij->i', radius, radius) < min_distance ** 2]] = True
+        return clash
+
+    if max_candidates is None:
+        max_candidates = 100 * particles_count + 10000
+    # Positions are kept per cell rather than per particle: neighbouring cells are close in memory
+    cells_count = int(np.prod(cells_per_axis))
+    occupied = np.zeros(cells_count, dtype=bool)
+    grid_positions = np.zeros((cells_count, dimensions))
+    batch_positions = np.zeros((cells_count, dimensions))
+    batch_priorities = np.full(cells_count, np.inf)
+    placed_count = 0
+    candidates_count = 0
+    acceptance = 0.5
+
+    while placed_count < particles_count:
+        if candidates_count > max_candidates:
+            raise ValueError(f'Placed {placed_count} of {particles_count} particles {min_distance} apart after '
+                             f'{candidates_count} candidates, the box is too full for random sequential addition')
+        # Enough candidates for the particles still missing at the acceptance rate of the last batch;
+        # sorted cells keep the lookups cache friendly
+        empty = np.flatnonzero(~occupied)
+        missing_count = particles_count - placed_count
+        batch_size = min(max(int(1.2 * missing_count / acceptance), 1024), 4 * particles_count)
+        cell_ids = np.sort(empty[rng.integers(0, len(empty), batch_size)])
+        cell_ids = cell_ids[np.concatenate(([True], cell_ids[1:] != cell_ids[:-1]))]
+        candidates_count += batch_size
+        cells = (cell_ids[:, np.newaxis] // cell_strides) % cells_per_axis
+        candidates = (cells + rng.random((len(cell_ids), dimensions))) * cell_length
+        priorities = rng.random(len(cell_ids))
+
+        # Against the particles placed so far, then against the candidates of the batch that come first
+        keep = ~clashes(candidates, neighbor_terms(cells), grid_positions, occupied)
+        candidates, cells, cell_ids, priorities = candidates[keep], cells[keep], cell_ids[keep], priorities[keep]
+        batch_positions[cell_ids] = candidates
+        batch_priorities[cell_ids] = priorities
+        keep = ~clashes(candidates, neighbor_terms(cells), batch_positions,
+                        grid_priorities=batch_priorities, priorities=priorities)
+        batch_priorities[cell_ids] = np.inf
+
+        accepted = np.flatnonzero(keep)
+        if len(accepted) > missing_count:
+            accepted = accepted[np.argsort(priorities[accepted])[:missing_count]]
+        acceptance = max(len(accepted) / batch_size, 1e-3)
+        grid_positions[cell_ids[accepted]] = candidates[accepted]
+        occupied[cell_ids[accepted]] = True
+        placed_count += len(accepted)
+    # In random order rather than by cell
+    return rng.permutation(grid_positions[occupied])
+
+
+def maxwell_boltzmann_velocities(masses, dimensions, temperature, rng: np.random.Generator):
+    # Normal components of variance T / m, without centre of mass motion and scaled to exactly temperature
+    # over the d (N - 1) degrees of freedom that are left (k_B = 1)
+    masses = np.asarray(masses, dtype=float)
+    velocities = rng.standard_normal((len(masses), dimensions)) * np.sqrt(temperature / masses)[:, np.newaxis]
+    velocities -= (masses @ velocities) / np.sum(masses)
+    kinetic_energy = 0.5 * np.einsum('i,ij,ij->', masses, velocities, velocities)
+    if kinetic_energy > 0:
+        velocities *= np.sqrt(temperature * dimensions * max(len(masses) - 1, 1) / (2 * kinetic_energy))
+    return velocities
+
+
+def make_particles(width, height, particles_count, cut_off_distance, velocity_mul=0, skin=None, depth=None, cells_per_cut_off=1,
+                   **kwargs):
+    # Exactly particles_count particles. kwargs:
+    #   lattice: 'square' (default), 'hex' (2D) or 'random' (random sequential addition, min_distance apart)
+    #   temperature: Maxwell-Boltzmann velocities at this temperature with zero total momentum, instead of
+    #                uniform components in [-velocity_mul / 2, velocity_mul / 2)
+    #   rng: np.random.Generator for random positions and velocities; without one uniform velocities come
+    #        from the global `random`, as they always did
+    box = [width, height] if depth is None else [width, height, depth]
+    dimensions = len(box)
+    lattice = kwargs.get('lattice', 'square')
+    temperature = kwargs.get('temperature', None)
+    rng = kwargs.get('rng', None)
+
+    arrays = ParticleArrays(particles_count, dimensions)
+    arrays.ids += Particle.last_particle_id
+    Particle.last_particle_id += particles_count
+
+    if lattice == 'random':
+        spacing = (np.prod(box) / max(particles_count, 1)) ** (1 / dimensions)
+        min_distance = kwargs.get('min_distance', min(1.0, 0.7 * spacing))
+        arrays.positions = random_sequential_addition(box, particles_count, min_distance,
+                                                      rng if rng is not None else np.random.default_rng())
+    else:
+        arrays.positions = lattice_positions(box, particles_count, lattice)
+
+    if temperature is not None:
+        arrays.velocities = maxwell_boltzmann_velocities(arrays.masses, dimensions, temperature,
+                                                         rng if rng is not None else np.random.default_rng())
+    elif rng is not None:
+        arrays.velocities = (rng.random((particles_count, dimensions)) - 0.5) * velocity_mul
+    else:
+        uniform = np.array([random() for _ in range(particles_count * dimensions)]).reshape(particles_count, dimensions)
+        arrays.velocities = np.multiply(uniform - 0.5, velocity_mul)
+
+    cells = ParticlesCells(width, height, cut_off_distance, skin, depth, cells_per_cut_off)
+    cells.update_cells(arrays)
 
     return cells
 
 
-def load_particles_from_file(width: float, height: float, cut_off_distance, file_name):
+def load_particles_from_file(width: float, height: float, cut_off_distance, file_name, skin=None):
     with open(file_name) as file:
         particles = [Particle.string2particle(line.strip()) for line in file.readlines()]
 
-    cells = ParticlesCells(width, height, cut_off_distance)
+    cells = ParticlesCells(width, height, cut_off_distance, skin)
     cells.update_cells(particles)
 
     return cells
@@ -1,32 +1,36 @@
-import matplotlib.pyplot as plt
 import numpy as np
 from particles_factory import ParticlesCells
-import calculator
+from observables import Observables
 
 
 class PlotLogger:
-    def __init__(self):
-        self.kinetic_energy = []
-        self.potential_energy = []
-        self.total_energy = []
+    def __init__(self, **kwargs):
+        self.observables = Observables(kwargs.get('capacity', 100000), kwargs.get('stride', 1))
 
-        self.center_of_mass_velocities = []
+    @property
+    def kinetic_energy(self):
+        return self.observables.values('kinetic_energy')
 
-    def log_particles(self, particles: ParticlesCells):
-        number = len(list(particles.iterate_throw_particles()))
-        kinetic_energy = sum([abs(p.velocity)**2 / 2 for p in particles.iterate_throw_particles()]) / number
-        potential_energy = sum([p.potential for p in particles.iterate_throw_particles()]) / number
+    @property
+    def potential_energy(self):
+        return self.observables.values('potential_energy')
+
+    @property
+    def total_energy(self):
+        return self.observables.values('total_energy')
 
-        self.kinetic_energy.append(kinetic_energy)
-        self.potential_energy.append(potential_energy / 2)
-        self.total_energy.append(kinetic_energy + potential_energy / 2)
+    def log_particles(self, particles: ParticlesCells):
+        self.observables.log_particles(particles)
 
-        self.center_of_mass_velocities.append(np.linalg.norm(calculator.calculate_center_of_mass_velocity(particles)))
+    def append(self, **values):
+        self.observables.append(**values)
 
     def dispose(self):
+        # Plotting is the only use of matplotlib, so headless runs never import it
+        import matplotlib.pyplot as plt
         colors = ['r', 'b', 'g']
 
-        if self.total_energy:
+        if len(self.total_energy):
             plt.subplot(1, 2, 1)
 
         keys = [
@@ -44,7 +48,7 @@ class PlotLogger:
         plt.legend(loc='best', shadow=True, fontsize='small')
 
         # Total Energy
-        if self.total_energy:
+        if len(self.total_energy):
             values = np.array(self.total_energy)
             mean_energy = np.mean(values)
 
@@ -0,0 +1,195 @@
+from functools import lru_cache
+import numpy as np
+
+
+# Pair potentials are evaluated from the squared distance only. Calling one returns (energy, force_over_r):
+# the pair energy U(r) and -U'(r) / r, so the force on j from i is r_ij * force_over_r and r . f = r^2 * force_over_r.
+class PairPotential:
+    # Distance beyond which the potential is exactly zero by construction, None when it has to be cut off
+    range = None
+
+    def parameters(self):
+        return ()
+
+    def __call__(self, distance_squared):
+        raise NotImplementedError()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.parameters() == other.parameters()
+
+    def __hash__(self):
+        return hash((type(self), self.parameters()))
+
+    def __repr__(self):
+        return f'{type(self).__name__}{self.parameters()}'
+
+
+class LennardJones(PairPotential):
+    def __init__(self, epsilon=1.0, sigma=1.0):
+        self.epsilon = epsilon
+        self.sigma = sigma
+
+    def parameters(self):
+        return (self.epsilon, self.sigma)
+
+    def __call__(self, distance_squared):
+        inverted_squared = 1 / distance_squared
+        inverted_6 = (inverted_squared * self.sigma ** 2) ** 3
+        energy = 4 * self.epsilon * inverted_6 * (inverted_6 - 1)
+        force_over_r = 48 * self.epsilon * inverted_squared * inverted_6 * (inverted_6 - 0.5)
+        return energy, force_over_r
+
+
+class WCA(LennardJones):
+    # Purely repulsive Lennard-Jones: cut at its minimum 2^(1/6) sigma and lifted by epsilon
+    @property
+    def range(self):
+        return 2 ** (1 / 6) * self.sigma
+
+    def __call__(self, distance_squared):
+        energy, force_over_r = super().__call__(distance_squared)
+        inside = distance_squared < self.range ** 2
+        return np.where(inside, energy + self.epsilon, 0.0), np.where(inside, force_over_r, 0.0)
+
+
+class UserPotential(PairPotential):
+    # Any pair function of r^2 given as energy(distance_squared) and force_over_r(distance_squared)
+    def __init__(self, energy, force_over_r, range=None):
+        self.energy = energy
+        self.force_over_r = force_over_r
+        self.range = range
+
+    def parameters(self):
+        return (self.energy, self.force_over_r, self.range)
+
+    def __call__(self, distance_squared):
+        return self.energy(distance_squared), self.force_over_r(distance_squared)
+
+
+# Cut-off treatments wrap a potential and precompute its values at the cut-off once
+
+class Shifted(PairPotential):
+    # U(r) - U(rc): the energy is continuous at the cut-off, the force is unchanged
+    def __init__(self, potential, cut_off_distance):
+        self.potential = potential
+        self.cut_off_distance = cut_off_distance
+        self.range = cut_off_distance
+        self.energy_shift = float(potential(cut_off_distance ** 2)[0])
+
+    def parameters(self):
+        return (self.potential, self.cut_off_distance)
+
+    def __call__(self, distance_squared):
+        energy, force_over_r = self.potential(distance_squared)
+        inside = distance_squared < self.cut_off_distance ** 2
+        return np.where(inside, energy - self.energy_shift, 0.0), np.where(inside, force_over_r, 0.0)
+
+
+class ShiftedForce(PairPotential):
+    # U(r) - U(rc) - (r - rc) U'(rc): energy and force both go to zero at the cut-off
+    def __init__(self, potential, cut_off_distance):
+        self.potential = potential
+        self.cut_off_distance = cut_off_distance
+        self.range = cut_off_distance
+        energy, force_over_r = potential(cut_off_distance ** 2)
+        self.energy_shift = float(energy)
+        self.force_shift = float(force_over_r) * cut_off_distance
+
+    def parameters(self):
+        return (self.potential, self.cut_off_distance)
+
+    def __call__(self, distance_squared):
+        energy, force_over_r = self.potential(distance_squared)
+        distance = np.sqrt(distance_squared)
+        inside = distance_squared < self.cut_off_distance ** 2
+        energy = energy - self.energy_shift + (distance - self.cut_off_distance) * self.force_shift
+        force_over_r = force_over_r - self.force_shift / distance
+        return np.where(inside, energy, 0.0), np.where(inside, force_over_r, 0.0)
+
+
+class Switched(PairPotential):
+    # U(r) S(r) for part='inner' or U(r) (1 - S(r)) for part='outer', S falling smoothly from 1 at switch_start
+    # to 0 at switch_end. The two parts add up to U exactly, which is how integrators.RESPA splits the forces.
+    def __init__(self, potential, switch_start, switch_end, part='inner'):
+        if part not in ('inner', 'outer'):
+            raise ValueError(f'Unknown part {part}')
+        self.potential = potential
+        self.switch_start = switch_start
+        self.switch_end = switch_end
+        self.part = part
+        self.range = switch_end if part == 'inner' else potential.range
+
+    def parameters(self):
+        return (self.potential, self.switch_start, self.switch_end, self.part)
+
+    def __call__(self, distance_squared):
+        energy, force_over_r = self.potential(distance_squared)
+        distance = np.sqrt(distance_squared)
+        width = self.switch_end - self.switch_start
+        s = np.clip((distance - self.switch_start) / width, 0.0, 1.0)
+        switch = 1 - s * s * (3 - 2 * s)
+        # -S'(r) / r
+        switch_derivative_over_r = 6 * s * (1 - s) / (width * distance)
+        if self.part == 'inner':
+            return energy * switch, force_over_r * switch + energy * switch_derivative_over_r
+        return energy * (1 - switch), force_over_r * (1 - switch) - energy * switch_derivative_over_r
+
+
+class Tabulated(PairPotential):
+    # Linear interpolation on a uniform grid over r^2 in [inner_distance^2, cut_off_distance^2];
+    # closer pairs are extrapolated from the first interval. Build it through tabulate() so tables are shared.
+    def __init__(self, potential, cut_off_distance, resolution=4096, inner_distance=0.5):
+        self.potential = potential
+        self.cut_off_distance = cut_off_distance
+        self.resolution = resolution
+        self.inner_distance = inner_distance
+        self.range = cut_off_distance
+
+        self.first = inner_distance ** 2
+        self.step = (cut_off_distance ** 2 - self.first) / (resolution - 1)
+        grid = self.first + self.step * np.arange(resolution)
+        # Rows are (energy, force_over_r) at the grid points
+        self.table = np.stack(potential(grid), axis=1)
+
+    def parameters(self):
+        return (self.potential, self.cut_off_distance, self.resolution, self.inner_distance)
+
+    def __call__(self, distance_squared):
+        # Arrays from the vectorised kernels, plain floats from the python backend
+        distance_squared = np.asarray(distance_squared, dtype=float)
+        position = (distance_squared - self.first) / self.step
+        index = np.clip(position.astype(int), 0, self.resolution - 2)
+        fraction = (position - index)[..., np.newaxis]
+        values = self.table[index] + fraction * (self.table[index + 1] - self.table[index])
+        inside = distance_squared < self.cut_off_distance ** 2
+        return np.where(inside, values[..., 0], 0.0), np.where(inside, values[..., 1], 0.0)
+
+
+def continuous_at_cut_off(potential, cut_off_distance):
+    # Whether the energy reaches zero by itself within the cut-off: a plain truncation jumps there, and the
+    # jumps of pairs crossing it show up as energy changes whatever the time step
+    if isinstance(potential, Tabulated) or (isinstance(potential, Switched) and potential.part == 'outer'):
+        return continuous_at_cut_off(potential.potential, min(potential.range or cut_off_distance, cut_off_distance))
+    return potential.range is not None and potential.range <= cut_off_distance
+
+
+@lru_cache(maxsize=None)
+def tabulate(potential, cut_off_distance, resolution=4096, inner_distance=0.5):
+    # One table per (potential, cut-off, resolution, inner distance), however many calculators ask for it
+    return Tabulated(potential, cut_off_distance, resolution, inner_distance)
+
+
+def make_potential(name, cut_off_distance, resolution=None):
+    # 'lj' (plain truncation), 'lj_shifted', 'lj_shifted_force' or 'wca', tabulated when a resolution is given
+    potentials = {
+        'lj': lambda: LennardJones(),
+        'lj_shifted': lambda: Shifted(LennardJones(), cut_off_distance),
+        'lj_shifted_force': lambda: ShiftedForce(LennardJones(), cut_off_distance),
+        'wca': lambda: WCA(),
+    }
+    if name not in potentials:
+        raise ValueError(f'Unknown potential {name}')
+    potential = potentials[name]()
+    if resolution:
+        potential = tabulate(potential, cut_off_distance, resolution)
+    return potential
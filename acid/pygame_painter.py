@@ -1,5 +1,7 @@
 import pygame
 import numpy as np
+from collections import deque
+from time import perf_counter
 from particles_factory import ParticlesCells
 
 # make abstract if additional visualization
@@ -13,6 +15,26 @@ class PygamePainter:
         self._background_color = kwargs.get("background_color", (50, 50, 50))
         self._particles_default_color = kwargs.get("particle_color", (255, 255, 255))
 
+        # 'sprites' blits one pre-rendered circle per (color, radius), 'surfarray' stamps outlines straight
+        # into the pixel buffer, 'circles' is the original pygame.draw.circle per particle and image
+        self._render_mode = kwargs.get("render_mode", "sprites")
+        self._sprites = {}
+        self._outlines = {}
+        self.frame_times = deque(maxlen=kwargs.get("frame_times_count", 120))
+
+    @property
+    def scale(self):
+        return self._scale
+
+    @scale.setter
+    def scale(self, scale):
+        # Pixels per length unit; the box always fills the screen, so it follows a box rescaled by a barostat
+        self._scale = scale
+
+    @property
+    def frame_time(self):
+        return sum(self.frame_times) / len(self.frame_times) if self.frame_times else 0.0
+
     def draw_background(self):
         self._screen.fill(self._background_color)
 
@@ -30,7 +52,77 @@ class PygamePainter:
 
 
     def draw_particles(self, particles: ParticlesCells):
-        self.draw_particles_(particles.iterate_throw_particles())
+        state = particles.arrays
+        self.draw_arrays(state.positions, state.radii, state.colors)
+
+    def draw_arrays(self, positions, radii, colors):
+        t1 = perf_counter()
+        scaled_centers = (positions * self._scale).astype(int)
+        scaled_radii = (radii * self._scale).astype(int)
+
+        self.draw_background()
+        if self._render_mode == "circles":
+            for scaled_center, radius, color in zip(scaled_centers, scaled_radii, colors):
+                self.draw_particle(scaled_center, radius, color)
+        else:
+            for color, indices in self._group_by_color(colors):
+                for radius in np.unique(scaled_radii[indices]).tolist():
+                    group = indices[scaled_radii[indices] == radius]
+                    if self._render_mode == "surfarray":
+                        self._stamp_outlines(scaled_centers[group], radius, color)
+                    else:
+                        self._blit_sprites(self._with_periodic_images(scaled_centers[group], radius), radius, color)
+
+        self.frame_times.append(perf_counter() - t1)
+
+    def _group_by_color(self, colors):
+        colored = [i for i, color in enumerate(colors) if color]
+        default = np.ones(len(colors), dtype=bool)
+        default[colored] = False
+        yield self._particles_default_color, np.flatnonzero(default)
+
+        for color in set(colors[i] for i in colored):
+            yield color, np.array([i for i in colored if colors[i] == color])
+
+    def _with_periodic_images(self, centers, radius):
+        # Ghost images only for the particles that stick out of an edge
+        x, y = centers[:, 0], centers[:, 1]
+        everything = np.ones(len(centers), dtype=bool)
+        shifts_x = ((everything, 0), (x < radius, self._width), (x >= self._width - radius, -self._width))
+        shifts_y = ((everything, 0), (y < radius, self._height), (y >= self._height - radius, -self._height))
+
+        images = [centers]
+        for mask_x, delta_x in shifts_x:
+            for mask_y, delta_y in shifts_y:
+                mask = mask_x & mask_y
+                if (delta_x or delta_y) and mask.any():
+                    images.append(centers[mask] + (delta_x, delta_y))
+        return np.concatenate(images)
+
+    def _blit_sprites(self, centers, radius, color):
+        key = (tuple(color), radius)
+        if key not in self._sprites:
+            sprite = pygame.Surface((2 * radius + 1, 2 * radius + 1), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, color, (radius, radius), radius, 1)
+            self._sprites[key] = sprite
+
+        sprite = self._sprites[key]
+        self._screen.blits([(sprite, topleft) for topleft in (centers - radius).tolist()], doreturn=False)
+
+    def _stamp_outlines(self, centers, radius, color):
+        if radius not in self._outlines:
+            delta_x, delta_y = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+            ring = np.abs(np.hypot(delta_x, delta_y) - radius) < 0.5
+            self._outlines[radius] = (delta_x[ring], delta_y[ring])
+
+        # Indices wrap modulo the screen, which draws the periodic images for free
+        delta_x, delta_y = self._outlines[radius]
+        xs = (centers[:, 0, np.newaxis] + delta_x) % self._width
+        ys = (centers[:, 1, np.newaxis] + delta_y) % self._height
+
+        pixels = pygame.surfarray.pixels2d(self._screen)
+        pixels[xs, ys] = self._screen.map_rgb(color)
+        del pixels
 
     def draw_particles_(self, particles):
         self.draw_background()
@@ -38,9 +130,12 @@ class PygamePainter:
         for particle in particles:
             scaled_center = np.multiply(particle.center.coordinates, self._scale).astype(int)
             radius = int(particle.radius * self._scale)
-            color = particle.color if particle.color else self._particles_default_color
-            # pygame.draw.circle(self._screen, color, scaled_center, radius, 2)
-            for delta_x in [-self._width, 0, self._width]:
-                for delta_y in [-self._height, 0, self._height]:
-                    center = np.add(scaled_center, [delta_x, delta_y])
-                    pygame.draw.circle(self._screen, color, center, radius, 1)
+            self.draw_particle(scaled_center, radius, particle.color)
+
+    def draw_particle(self, scaled_center, radius, color=None):
+        color = color if color else self._particles_default_color
+        # pygame.draw.circle(self._screen, color, scaled_center, radius, 2)
+        for delta_x in [-self._width, 0, self._width]:
+            for delta_y in [-self._height, 0, self._height]:
+                center = np.add(scaled_center, [delta_x, delta_y])
+                pygame.draw.circle(self._screen, color, center, radius, 1)
@@ -0,0 +1,209 @@
+import argparse
+import os
+import numpy as np
+from time import perf_counter
+from calculator import Calculator, get_width_height, calculate_center_of_mass_velocity
+from particles_factory import ParticlesCells, make_particles
+from trajectory import TrajectoryWriter
+from observables import Observables
+from observer_bus import ObserverBus
+from instrumentation import Instrumentation
+from checkpoint import Checkpointer, load_checkpoint, latest_checkpoint
+from potentials import make_potential
+from integrators import make_integrator
+from thermostats import make_stages
+
+
+class ConsoleLogger:
+    def __init__(self):
+        self.observables = Observables(capacity=1)
+
+    def log_particles(self, particles: ParticlesCells):
+        values = self.observables.measure(particles)
+        print(', '.join(f'{field} = {value:.6g}' for field, value in values.items()))
+
+
+# Steps the calculator without any display; observers are objects with log_particles(particles)
+class Simulation:
+    def __init__(self, particles: ParticlesCells, calculator: Calculator):
+        self.particles = particles
+        self.calculator = calculator
+        self.observers = []
+
+    def attach(self, observer, stride=1):
+        self.observers.append((observer, stride))
+
+    def run(self, n_steps):
+        pairs_evaluated = 0
+        simulated_time = 0.0
+        t1 = perf_counter()
+        for _ in range(n_steps):
+            simulated_time += self.calculator.step(self.particles)
+            pairs_evaluated += self.calculator.pairs_count
+
+            for observer, stride in self.observers:
+                if self.particles.iteration_index % stride == 0:
+                    observer.log_particles(self.particles)
+        elapsed = perf_counter() - t1
+
+        return {
+            'steps': n_steps,
+            'particles': len(self.particles.arrays),
+            'seconds': elapsed,
+            'steps_per_second': n_steps / elapsed if elapsed else float('inf'),
+            'pairs_per_second': pairs_evaluated / elapsed if elapsed else float('inf'),
+            'simulated_time': simulated_time,
+            'simulated_time_per_second': simulated_time / elapsed if elapsed else float('inf'),
+        }
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Headless Lennard-Jones simulation')
+    parser.add_argument('--particles', type=int, default=100)
+    parser.add_argument('--density', type=float, default=0.81)
+    parser.add_argument('--dimensions', type=int, default=2, choices=[2, 3])
+    parser.add_argument('--cut-off-distance', type=float, default=2.5)
+    parser.add_argument('--delta-time', type=float, default=0.001)
+    parser.add_argument('--velocity-mul', type=float, default=16)
+    parser.add_argument('--lattice', default='square', choices=['square', 'hex', 'random'])
+    parser.add_argument('--min-distance', type=float, default=None, help='closest approach of random positions')
+    parser.add_argument('--initial-temperature', type=float, default=None,
+                        help='Maxwell-Boltzmann velocities at this temperature instead of --velocity-mul')
+    parser.add_argument('--skin', type=float, default=None)
+    parser.add_argument('--cells-per-cut-off', type=int, default=1, help='finer cell grid with a wider stencil, 2 pays off in 3D')
+    parser.add_argument('--potential', default=None, choices=['lj', 'lj_shifted', 'lj_shifted_force', 'wca'],
+                        help='lj by default, lj_shifted_force with --adaptive')
+    parser.add_argument('--table-resolution', type=int, default=None, help='interpolate the potential from a table over r^2')
+    parser.add_argument('--integrator', default='velocity_verlet', choices=['velocity_verlet', 'leapfrog', 'respa'])
+    parser.add_argument('--respa-inner-steps', type=int, default=4, help='inner steps per outer RESPA step')
+    parser.add_argument('--respa-inner-cut-off', type=float, default=1.5, help='range of the fast RESPA forces')
+    parser.add_argument('--adaptive', action='store_true', help='adapt dt to the energy change and the largest force')
+    parser.add_argument('--tolerance', type=float, default=1e-4, help='energy change per step allowed, relative to kinetic')
+    parser.add_argument('--max-delta-time', type=float, default=0.01)
+    parser.add_argument('--thermostat', default=None, choices=['berendsen', 'velocity_rescale', 'langevin'])
+    parser.add_argument('--temperature', type=float, default=1.0, help='target of the thermostat')
+    parser.add_argument('--thermostat-time-constant', type=float, default=0.1)
+    parser.add_argument('--friction', type=float, default=1.0, help='Langevin friction rate')
+    parser.add_argument('--barostat', action='store_true', help='Berendsen barostat rescaling the box')
+    parser.add_argument('--pressure', type=float, default=1.0, help='target of the barostat')
+    parser.add_argument('--barostat-time-constant', type=float, default=1.0)
+    parser.add_argument('--compressibility', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed of the initial state and the stochastic thermostats, restored on --resume')
+    parser.add_argument('--backend', default='numpy', choices=['numpy', 'numba', 'numba_parallel', 'python'])
+    parser.add_argument('--workers', type=int, default=None, help='worker processes for the force phase')
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--log-stride', type=int, default=0, help='print energies every N steps, 0 disables')
+    parser.add_argument('--trajectory', default=None, help='binary trajectory file to append frames to')
+    parser.add_argument('--trajectory-stride', type=int, default=10)
+    parser.add_argument('--observer-policy', default='sync', choices=['sync'] + list(ObserverBus.POLICIES),
+                        help='run observers inline or on worker threads with the given backpressure policy')
+    parser.add_argument('--checkpoint-dir', default=None, help='write checkpoints into this directory')
+    parser.add_argument('--checkpoint-stride', type=int, default=1000)
+    parser.add_argument('--checkpoint-keep', type=int, default=3)
+    parser.add_argument('--resume', default=None, help='checkpoint file to continue from, or a checkpoint directory for its latest one')
+    parser.add_argument('--instrument', default=None, help='write per-phase timings and counters as JSON')
+    parser.add_argument('--trace', default=None, help='write per-phase timings in Chrome trace event format')
+    parser.add_argument('--profile', default=None, help='run under cProfile and dump the stats to this file')
+    parser.add_argument('--tracemalloc', action='store_true', help='print the top allocation sites at the end')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    if arguments.potential is None:
+        # The energy change only tells the adaptive time step about dt when nothing jumps at the cut-off
+        arguments.potential = 'lj_shifted_force' if arguments.adaptive else 'lj'
+
+    rng = np.random.default_rng(arguments.seed)
+    if arguments.resume:
+        if os.path.isdir(arguments.resume):
+            directory = arguments.resume
+            arguments.resume = latest_checkpoint(directory)
+            if arguments.resume is None:
+                raise FileNotFoundError(f'No checkpoint in {directory}')
+        # Box, cut-off, skin and dt come from the checkpoint so the trajectory continues exactly
+        particles, metadata = load_checkpoint(arguments.resume, rng)
+        width, height, depth = particles.width, particles.height, particles.depth
+        arguments.cut_off_distance, arguments.delta_time = metadata['cut_off_distance'], metadata['delta_time']
+    else:
+        width, height, *depth = get_width_height(arguments.particles, arguments.density, arguments.dimensions)
+        depth = depth[0] if depth else None
+        options = {'min_distance': arguments.min_distance} if arguments.min_distance is not None else {}
+        particles = make_particles(width, height, arguments.particles, arguments.cut_off_distance,
+                                   velocity_mul=arguments.velocity_mul, skin=arguments.skin, depth=depth,
+                                   cells_per_cut_off=arguments.cells_per_cut_off, lattice=arguments.lattice,
+                                   temperature=arguments.initial_temperature, rng=rng, **options)
+        particles.arrays.velocities -= calculate_center_of_mass_velocity(particles)
+
+    observer_bus = ObserverBus(arguments.observer_policy) if arguments.observer_policy != 'sync' else None
+    instrumentation = None
+    if arguments.instrument or arguments.trace:
+        instrumentation = Instrumentation(trace_events_count=100000 if arguments.trace else 0)
+    integrator_options = {}
+    if arguments.integrator == 'respa':
+        integrator_options = {'inner_steps': arguments.respa_inner_steps, 'inner_cut_off': arguments.respa_inner_cut_off}
+    adaptive = arguments.adaptive and {'tolerance': arguments.tolerance, 'max_delta_time': arguments.max_delta_time}
+    integrator = make_integrator(arguments.integrator, adaptive, **integrator_options)
+    if arguments.resume and metadata.get('integrator_state') and hasattr(integrator, 'restore'):
+        integrator.restore(metadata['integrator_state'])
+    calculator = Calculator(width, height, particles, depth=depth, delta_time=arguments.delta_time,
+                            cut_off_distance=arguments.cut_off_distance, backend=arguments.backend,
+                            workers=arguments.workers, observer_bus=observer_bus, instrumentation=instrumentation,
+                            integrator=integrator, stages=make_stages(
+                                arguments.thermostat, arguments.temperature, arguments.barostat, arguments.pressure, rng,
+                                time_constant=arguments.thermostat_time_constant, friction=arguments.friction,
+                                barostat_time_constant=arguments.barostat_time_constant,
+                                compressibility=arguments.compressibility),
+                            potential=make_potential(arguments.potential, arguments.cut_off_distance, arguments.table_resolution))
+    simulation = Simulation(particles, calculator)
+    attach = observer_bus.subscribe if observer_bus else simulation.attach
+
+    if arguments.log_stride > 0:
+        attach(ConsoleLogger(), arguments.log_stride)
+    trajectory_writer = None
+    if arguments.trajectory:
+        trajectory_writer = TrajectoryWriter(arguments.trajectory, particles, arguments.delta_time, arguments.trajectory_stride)
+        attach(trajectory_writer, arguments.trajectory_stride)
+    if arguments.checkpoint_dir:
+        # Checkpoints stay synchronous: they must capture the exact state of their iteration
+        simulation.attach(Checkpointer(arguments.checkpoint_dir, calculator, arguments.checkpoint_keep, rng),
+                          arguments.checkpoint_stride)
+
+    if arguments.tracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+    if arguments.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        report = profiler.runcall(simulation.run, arguments.steps)
+        profiler.dump_stats(arguments.profile)
+    else:
+        report = simulation.run(arguments.steps)
+    calculator.close()
+
+    if arguments.tracemalloc:
+        for statistic in tracemalloc.take_snapshot().statistics('lineno')[:10]:
+            print(statistic)
+        tracemalloc.stop()
+    if instrumentation:
+        print(instrumentation)
+        if arguments.instrument:
+            instrumentation.write_json(arguments.instrument)
+        if arguments.trace:
+            instrumentation.write_chrome_trace(arguments.trace)
+    if observer_bus:
+        observer_bus.close()
+    if trajectory_writer:
+        trajectory_writer.dispose()
+    print(f"{report['steps']} steps of {report['particles']} particles in {report['seconds']:.3f}s: "
+          f"{report['steps_per_second']:.1f} steps/s, {report['pairs_per_second']:.3e} pairs/s, "
+          f"{report['simulated_time_per_second']:.4g} time units/s")
+    if arguments.adaptive:
+        print(f'dt = {calculator.delta_time:.4g} after {integrator.growths_count} growths and {integrator.shrinks_count} '
+              f'shrinks, energy drift {integrator.drift:.3e} of kinetic, max force {integrator.max_force:.4g}')
+    return report
+
+
+if __name__ == '__main__':
+    main()
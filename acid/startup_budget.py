@@ -0,0 +1,61 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Headless entry points and the core they pull in must import with NumPy only
+ENTRY_POINTS = ('simulation', 'ensemble', 'sweep', 'calculator', 'particles_factory', 'trajectory', 'checkpoint')
+# GUI, plotting, JIT and process pool backends, loaded on first use only
+FORBIDDEN_MODULES = ('matplotlib', 'pygame', 'numba', 'scipy', 'multiprocessing')
+# Import time allowed per entry point besides numpy
+BUDGET_MS = 75
+
+
+def import_times(module):
+    # {imported module: cumulative microseconds} from python -X importtime in a fresh interpreter
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def check(module, budget_ms, repeats=3):
+    # Best of several runs, counting only what the module adds on top of NumPy
+    runs = [import_times(module) for _ in range(repeats)]
+    own_ms = min(times[module] - times.get('numpy', 0) for times in runs) / 1000
+    forbidden = sorted({name.split('.')[0] for name in runs[0]} & set(FORBIDDEN_MODULES))
+
+    problems = []
+    if forbidden:
+        problems.append(f'imports {", ".join(forbidden)}')
+    if own_ms > budget_ms:
+        problems.append(f'takes {own_ms:.1f} ms on top of numpy, the budget is {budget_ms} ms')
+    return own_ms, problems
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Check the import time of the headless entry points')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help='import time allowed per entry point besides numpy')
+    parser.add_argument('--modules', nargs='+', default=list(ENTRY_POINTS))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    failed = False
+    for module in arguments.modules:
+        own_ms, problems = check(module, arguments.budget_ms)
+        print(f'{module}: {own_ms:.1f} ms' + (f' - FAILED: {"; ".join(problems)}' if problems else ''))
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+from time import perf_counter
+from calculator import Calculator, get_width_height, calculate_center_of_mass_velocity
+from particles_factory import make_particles
+from observables import Observables
+
+# Part of every cache key: bump it when run_point starts producing different numbers for the same parameters
+CACHE_VERSION = 2
+
+
+def sweep_points(particles, densities, cut_off_distances, delta_times, velocity_muls, **kwargs):
+    # Full grid over the five physical parameters; steps, equilibration_steps, sample_stride and seed are shared
+    shared = {
+        'steps': kwargs.get('steps', 1000),
+        'equilibration_steps': kwargs.get('equilibration_steps', 0),
+        'sample_stride': kwargs.get('sample_stride', 10),
+        'seed': kwargs.get('seed', 0),
+    }
+    return [
+        {'particles': particles_count, 'density': density, 'cut_off_distance': cut_off_distance,
+         'delta_time': delta_time, 'velocity_mul': velocity_mul, **shared}
+        for particles_count, density, cut_off_distance, delta_time, velocity_mul
+        in itertools.product(particles, densities, cut_off_distances, delta_times, velocity_muls)
+    ]
+
+
+def point_key(point):
+    description = json.dumps({'version': CACHE_VERSION, **point}, sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()[:20]
+
+
+def run_point(point):
+    random.seed(point['seed'])
+    width, height = get_width_height(point['particles'], point['density'])
+    particles = make_particles(width, height, point['particles'], point['cut_off_distance'], velocity_mul=point['velocity_mul'])
+    particles.arrays.velocities -= calculate_center_of_mass_velocity(particles)
+    calculator = Calculator(width, height, particles, delta_time=point['delta_time'], cut_off_distance=point['cut_off_distance'])
+    calculator.compute_accelerations_and_potentials(particles)
+
+    t1 = perf_counter()
+    for _ in range(point['equilibration_steps']):
+        calculator.iteration_2(particles, log_time=False)
+
+    observables = Observables(capacity=max(point['steps'] // point['sample_stride'], 1), stride=point['sample_stride'])
+    for _ in range(point['steps']):
+        calculator.iteration_2(particles, log_time=False)
+        observables.log_particles(particles)
+    elapsed = perf_counter() - t1
+
+    summary = {}
+    for field in Observables.FIELDS:
+        values = observables.values(field)
+        summary[field] = {
+            'mean': float(values.mean()) if len(values) else None,
+            'std': float(values.std()) if len(values) else None,
+            'last': float(values[-1]) if len(values) else None,
+        }
+    return {'parameters': point, 'summary': summary, 'seconds': elapsed}
+
+
+class ResultCache:
+    # One JSON file per sweep point, named after point_key; a file only appears once its run has finished
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, point):
+        return os.path.join(self.directory, f'{point_key(point)}.json')
+
+    def __contains__(self, point):
+        return os.path.exists(self.path(point))
+
+    def load(self, point):
+        with open(self.path(point)) as file:
+            return json.load(file)
+
+    def store(self, result):
+        path = self.path(result['parameters'])
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(result, file, indent=2)
+        os.replace(f'{path}.tmp', path)
+
+
+def run_sweep(points, cache_directory, workers=None, chunk_size=1, progress=None):
+    # Points already in the cache are skipped, so an interrupted sweep resumes where it stopped
+    cache = ResultCache(cache_directory)
+    pending = [point for point in points if point not in cache]
+
+    if pending:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for result in executor.map(run_point, pending, chunksize=chunk_size):
+                cache.store(result)
+                if progress is not None:
+                    progress(result)
+
+    return [cache.load(point) for point in points]
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Run a parameter grid of headless simulations on a process pool')
+    parser.add_argument('--particles', type=int, nargs='+', default=[100])
+    parser.add_argument('--densities', type=float, nargs='+', default=[0.81])
+    parser.add_argument('--cut-off-distances', type=float, nargs='+', default=[2.5])
+    parser.add_argument('--delta-times', type=float, nargs='+', default=[0.001])
+    parser.add_argument('--velocity-muls', type=float, nargs='+', default=[16])
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--equilibration-steps', type=int, default=0)
+    parser.add_argument('--sample-stride', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='defaults to the number of CPUs')
+    parser.add_argument('--chunk-size', type=int, default=1, help='points handed to a worker at once')
+    parser.add_argument('--cache', default='sweep_cache', help='directory with one result file per point')
+    parser.add_argument('--output', default=None, help='write every result of the sweep into one JSON file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    points = sweep_points(arguments.particles, arguments.densities, arguments.cut_off_distances,
+                          arguments.delta_times, arguments.velocity_muls, steps=arguments.steps,
+                          equilibration_steps=arguments.equilibration_steps, sample_stride=arguments.sample_stride,
+                          seed=arguments.seed)
+    cached_count = sum(point in ResultCache(arguments.cache) for point in points)
+    print(f'{len(points)} points, {cached_count} cached')
+
+    def progress(result):
+        parameters, summary = result['parameters'], result['summary']
+        print(f"N={parameters['particles']} density={parameters['density']} cut_off={parameters['cut_off_distance']} "
+              f"dt={parameters['delta_time']} velocity_mul={parameters['velocity_mul']}: "
+              f"temperature = {summary['temperature']['mean']:.6g}, pressure = {summary['pressure']['mean']:.6g} "
+              f"({result['seconds']:.2f}s)")
+
+    results = run_sweep(points, arguments.cache, arguments.workers, arguments.chunk_size, progress)
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+import pytest
+from startup_budget import BUDGET_MS, ENTRY_POINTS, check
+
+
+@pytest.mark.parametrize('module', ENTRY_POINTS)
+def test_entry_point_imports_within_budget(module):
+    _, problems = check(module, BUDGET_MS)
+    assert not problems, f'{module}: {"; ".join(problems)}'
@@ -0,0 +1,129 @@
+import numpy as np
+from particles_factory import ParticlesCells
+
+
+# Stages run at the end of every step, after the integrator and before observers, via Calculator.stages:
+# stage.apply(calculator, particles, time_step) works on whole arrays. Temperature and pressure are measured
+# as in observables.Observables, with k_B = 1 and the centre of mass motion taking no degrees of freedom.
+
+def degrees_of_freedom(particles: ParticlesCells):
+    number, dimensions = particles.arrays.positions.shape
+    return dimensions * max(number - 1, 1)
+
+
+def kinetic_energy(particles: ParticlesCells):
+    state = particles.arrays
+    return 0.5 * np.einsum('i,ij,ij->', state.masses, state.velocities, state.velocities)
+
+
+def temperature(particles: ParticlesCells):
+    return 2 * kinetic_energy(particles) / degrees_of_freedom(particles)
+
+
+def pressure(particles: ParticlesCells):
+    # Virial pressure; the virial is the one of the last force computation
+    state = particles.arrays
+    number, dimensions = state.positions.shape
+    return (number * temperature(particles) + state.virial / dimensions) / np.prod(particles.box)
+
+
+class BerendsenThermostat:
+    # Weak coupling: velocities scaled by sqrt(1 + dt / tau (T0 / T - 1)), so T relaxes to T0 with time constant tau.
+    # Fast and smooth, but it suppresses the kinetic energy fluctuations of the canonical ensemble
+    def __init__(self, temperature, time_constant=0.1):
+        self.temperature = temperature
+        self.time_constant = time_constant
+
+    def apply(self, calculator, particles: ParticlesCells, time_step):
+        current = temperature(particles)
+        if current > 0:
+            factor = 1 + time_step / self.time_constant * (self.temperature / current - 1)
+            particles.arrays.velocities *= np.sqrt(max(factor, 0.0))
+
+
+class VelocityRescale:
+    # Bussi, Donadio, Parrinello (2007): Berendsen with a stochastic term, the kinetic energy follows the canonical
+    # distribution. One scale factor per step from a normal and a chi-squared number, whatever the system size
+    def __init__(self, temperature, time_constant=0.1, rng: np.random.Generator = None):
+        self.temperature = temperature
+        self.time_constant = time_constant
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def apply(self, calculator, particles: ParticlesCells, time_step):
+        kinetic = kinetic_energy(particles)
+        if kinetic <= 0:
+            return
+        dof = degrees_of_freedom(particles)
+        target_per_dof = 0.5 * self.temperature
+        decay = np.exp(-time_step / self.time_constant)
+
+        first = self.rng.standard_normal()
+        rest = self.rng.chisquare(dof - 1) if dof > 1 else 0.0
+        new_kinetic = (kinetic * decay + target_per_dof * (1 - decay) * (first ** 2 + rest)
+                       + 2 * first * np.sqrt(decay * (1 - decay) * target_per_dof * kinetic))
+        factor = np.sqrt(max(new_kinetic, 0.0) / kinetic)
+        # The root with the sign of the underlying Ornstein-Uhlenbeck step
+        if first + np.sqrt(decay * kinetic / ((1 - decay) * target_per_dof)) < 0:
+            factor = -factor
+        particles.arrays.velocities *= factor
+
+
+class LangevinThermostat:
+    # Friction and noise per particle as the exact Ornstein-Uhlenbeck update v = c v + sqrt((1 - c^2) T / m) xi,
+    # c = exp(-friction dt), i.e. the velocity Verlet + O splitting. The noise kicks the centre of mass too,
+    # which is taken out again unless zero_momentum is off
+    def __init__(self, temperature, friction=1.0, rng: np.random.Generator = None, zero_momentum=True):
+        self.temperature = temperature
+        self.friction = friction
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.zero_momentum = zero_momentum
+
+    def apply(self, calculator, particles: ParticlesCells, time_step):
+        state = particles.arrays
+        decay = np.exp(-self.friction * time_step)
+        noise = self.rng.standard_normal(state.velocities.shape)
+        state.velocities *= decay
+        state.velocities += noise * np.sqrt((1 - decay ** 2) * self.temperature / state.masses)[:, np.newaxis]
+        if self.zero_momentum:
+            state.velocities -= (state.masses @ state.velocities) / np.sum(state.masses)
+
+
+class BerendsenBarostat:
+    # Weak coupling of the pressure: box and positions scaled by mu = (1 - compressibility dt / tau (P0 - P))^(1/d)
+    # through Calculator.rescale_box, which keeps the cell grid in step. mu is limited to 1 +- max_scale per step,
+    # and the box never shrinks below two cut-offs, the least the minimum image convention needs
+    def __init__(self, pressure, time_constant=1.0, compressibility=1.0, max_scale=0.01):
+        self.pressure = pressure
+        self.time_constant = time_constant
+        self.compressibility = compressibility
+        self.max_scale = max_scale
+
+    def apply(self, calculator, particles: ParticlesCells, time_step):
+        dimensions = particles.dimensions
+        current = pressure(particles)
+        factor = max(1 - self.compressibility * time_step / self.time_constant * (self.pressure - current), 0.0)
+        scale = np.clip(factor ** (1 / dimensions), 1 - self.max_scale, 1 + self.max_scale)
+        if scale < 1:
+            scale = max(scale, min(2 * particles.list_distance / np.min(particles.box), 1.0))
+        if scale != 1.0:
+            calculator.rescale_box(particles, scale)
+
+
+def make_stages(thermostat=None, temperature=1.0, barostat=False, pressure=1.0, rng: np.random.Generator = None, **kwargs):
+    # thermostat is None, 'berendsen', 'velocity_rescale' or 'langevin'; kwargs: time_constant, friction,
+    # barostat_time_constant, compressibility
+    stages = []
+    time_constant = kwargs.get('time_constant', 0.1)
+    thermostats = {
+        'berendsen': lambda: BerendsenThermostat(temperature, time_constant),
+        'velocity_rescale': lambda: VelocityRescale(temperature, time_constant, rng),
+        'langevin': lambda: LangevinThermostat(temperature, kwargs.get('friction', 1.0), rng),
+    }
+    if thermostat is not None:
+        if thermostat not in thermostats:
+            raise ValueError(f'Unknown thermostat {thermostat}')
+        stages.append(thermostats[thermostat]())
+    if barostat:
+        stages.append(BerendsenBarostat(pressure, kwargs.get('barostat_time_constant', 1.0),
+                                        kwargs.get('compressibility', 1.0)))
+    return stages
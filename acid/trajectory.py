@@ -0,0 +1,114 @@
+import numpy as np
+from particles_factory import ParticlesCells
+
+# File layout: header | ids (N x int64) | frame, frame, ... where every frame has the same size,
+# so frame k starts at a computable offset and the whole frame section maps onto one np.memmap.
+MAGIC = b'ACIDTRJ1'
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('particles_count', '<u8'),
+    ('dimensions', '<u4'),
+    ('float_size', '<u4'),
+    ('box', '<f8', (3,)),
+    ('delta_time', '<f8'),
+    ('stride', '<u8'),
+])
+
+
+def frame_dtype(particles_count, dimensions, float_type):
+    return np.dtype([
+        ('step', '<i8'),
+        ('positions', float_type, (particles_count, dimensions)),
+        ('velocities', float_type, (particles_count, dimensions)),
+        ('potentials', float_type, (particles_count,)),
+    ])
+
+
+class TrajectoryWriter:
+    def __init__(self, file_path, particles: ParticlesCells, delta_time, stride=1, float_type=np.float32, chunk_frames=64):
+        state = particles.arrays
+        particles_count, dimensions = state.positions.shape
+        self.stride = stride
+        self.frame_dtype = frame_dtype(particles_count, dimensions, float_type)
+
+        header = np.zeros((), dtype=HEADER_DTYPE)
+        header['magic'] = MAGIC
+        header['particles_count'] = particles_count
+        header['dimensions'] = dimensions
+        header['float_size'] = np.dtype(float_type).itemsize
+        header['box'][:dimensions] = particles.box
+        header['delta_time'] = delta_time
+        header['stride'] = stride
+
+        self.file = open(file_path, 'wb')
+        self.file.write(header.tobytes())
+        self.file.write(state.ids.astype('<i8').tobytes())
+
+        # Frames are collected into a chunk and appended with one write
+        self.chunk = np.zeros(chunk_frames, dtype=self.frame_dtype)
+        self.chunk_size = 0
+        self.frames_count = 0
+
+    def log_particles(self, particles: ParticlesCells):
+        state = particles.arrays
+        frame = self.chunk[self.chunk_size]
+        frame['step'] = particles.iteration_index
+        frame['positions'] = state.positions
+        frame['velocities'] = state.velocities
+        frame['potentials'] = state.potentials
+
+        self.chunk_size += 1
+        self.frames_count += 1
+        if self.chunk_size == len(self.chunk):
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.chunk[:self.chunk_size].tobytes())
+        self.file.flush()
+        self.chunk_size = 0
+
+    def dispose(self):
+        self.flush()
+        self.file.close()
+
+
+class TrajectoryReader:
+    def __init__(self, file_path):
+        header = np.fromfile(file_path, dtype=HEADER_DTYPE, count=1)[0]
+        if header['magic'] != MAGIC:
+            raise ValueError(f'{file_path} is not a trajectory file')
+
+        self.particles_count = int(header['particles_count'])
+        self.dimensions = int(header['dimensions'])
+        self.box = tuple(header['box'][:self.dimensions].tolist())
+        self.delta_time = float(header['delta_time'])
+        self.stride = int(header['stride'])
+
+        float_type = np.dtype(f"<f{header['float_size']}")
+        self.ids = np.fromfile(file_path, dtype='<i8', count=self.particles_count, offset=HEADER_DTYPE.itemsize)
+        self.frame_dtype = frame_dtype(self.particles_count, self.dimensions, float_type)
+
+        # A run that died mid-chunk leaves a partial frame at the end; it is ignored
+        offset = HEADER_DTYPE.itemsize + self.ids.nbytes
+        with open(file_path, 'rb') as file:
+            file.seek(0, 2)
+            frames_count = (file.tell() - offset) // self.frame_dtype.itemsize
+        self.frames = np.memmap(file_path, dtype=self.frame_dtype, mode='r', offset=offset, shape=(frames_count,))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    @property
+    def positions(self):
+        return self.frames['positions']
+
+    @property
+    def velocities(self):
+        return self.frames['velocities']
+
+    @property
+    def potentials(self):
+        return self.frames['potentials']
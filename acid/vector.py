@@ -16,13 +16,13 @@ class Vector2D:
         return str(self)
 
     def __add__(self, other):
-        return Vector2D(coordinates=np.add(self.coordinates, other.coordinates))
+        return type(self)(coordinates=np.add(self.coordinates, other.coordinates))
 
     def __sub__(self, other):
-        return Vector2D(coordinates=np.subtract(self.coordinates, other.coordinates))
+        return type(self)(coordinates=np.subtract(self.coordinates, other.coordinates))
 
     def __mul__(self, scalar):
-        return Vector2D(coordinates=np.multiply(self.coordinates, scalar))
+        return type(self)(coordinates=np.multiply(self.coordinates, scalar))
 
     def __abs__(self):
         return np.linalg.norm(self.coordinates)
@@ -49,3 +49,25 @@ class Vector2D:
             self.coordinates[1] = y
 
 
+class Vector3D(Vector2D):
+    def __init__(self, x: float = 0.0, y: float = 0.0, z: float = 0.0, coordinates: np.ndarray=None):
+        if (coordinates is None):
+            coordinates = np.array([x, y, z])
+        super().__init__(coordinates=coordinates)
+
+    def __str__(self):
+        return f'({self.x}, {self.y}, {self.z})'
+
+    @property
+    def z(self):
+        return self.coordinates[2]
+
+    @z.setter
+    def z(self, z):
+        if (isinstance(z, numbers.Number)):
+            self.coordinates[2] = z
+
+
+def vector_of(coordinates: np.ndarray):
+    # Vector wrapping the given coordinates array without copying it
+    return Vector2D(coordinates=coordinates) if len(coordinates) == 2 else Vector3D(coordinates=coordinates)